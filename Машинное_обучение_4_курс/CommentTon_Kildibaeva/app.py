@@ -12,73 +12,77 @@ st.set_page_config(
 
 st.title("💬 Анализ тональности комментариев")
 
+PAGE_SIZE = 100
+# Сводка меняется медленно, а API и сам кэширует её; страницы обновляются чаще
+SUMMARY_TTL = 300
+PAGE_TTL = 60
+
 tab1, tab2 = st.tabs(["📋 Все комментарии", "✏️ Проверить текст"])
 
 
-@st.cache_data(ttl=60)
-def get_comment_probability(comment_id):
-    try:
-        response = requests.post(f"{API_URL}/comments/{comment_id}/predict", timeout=5)
-        if response.status_code == 200:
-            data = response.json()
-            return {
-                'toxic_prob': data['probability'],
-                'positive_prob': 1 - data['probability']
-            }
-    except:
-        pass
-    return None
+@st.cache_resource
+def get_session():
+    """Общая HTTP-сессия с пулом keep-alive соединений к API"""
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=16)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
 
 
-with tab1:
-    st.header("📋 Все комментарии")
-    with st.spinner("Загрузка комментариев..."):
-        response = requests.get(f"{API_URL}/comments")
+@st.cache_data(ttl=PAGE_TTL)
+def get_comments_page(after_id, limit=PAGE_SIZE):
+    """Одна страница комментариев с сохранёнными вероятностями и курсор следующей"""
+    response = get_session().get(f"{API_URL}/comments", params={"after_id": after_id, "limit": limit}, timeout=10)
+    response.raise_for_status()
+    next_after_id = response.headers.get("X-Next-After-Id")
+    return response.json(), int(next_after_id) if next_after_id else None
 
-    if response.status_code == 200:
-        comments = response.json()
-        if comments:
-            df = pd.DataFrame(comments)
 
-            display_data = []
+@st.cache_data(ttl=SUMMARY_TTL)
+def get_comments_summary():
+    """Счётчики комментариев для подписи страницы и кнопки массового анализа"""
+    response = get_session().get(f"{API_URL}/comments/summary", timeout=10)
+    response.raise_for_status()
+    return response.json()
 
-            progress_bar = st.progress(0)
-            status_text = st.empty()
 
-            for idx, row in df.iterrows():
-                status_text.text(f"Загрузка вероятностей: {idx + 1}/{len(df)}")
+def format_sentiment(comment_ton, probability):
+    if pd.isna(comment_ton):
+        return "⏳ Не определен"
+    if comment_ton == 0:
+        return f"✅ Позитивный ({1 - probability:.2%})" if pd.notna(probability) else "✅ Позитивный"
+    return f"🔴 Токсичный ({probability:.2%})" if pd.notna(probability) else "🔴 Токсичный"
 
-                comment_info = {
-                    'ID': row['comment_id'],
-                    'Текст комментария': row['comment_text'][:100] + "..." if len(row['comment_text']) > 100 else row[
-                        'comment_text'],
-                    'Тональность': row['comment_ton']
-                }
 
-                if pd.notna(row['comment_ton']):
-                    prob_data = get_comment_probability(row['comment_id'])
-                    if prob_data:
-                        if row['comment_ton'] == 0:
-                            comment_info[
-                                'Тональность с вероятностью'] = f"✅ Позитивный ({prob_data['positive_prob']:.2%})"
-                        else:
-                            comment_info['Тональность с вероятностью'] = f"🔴 Токсичный ({prob_data['toxic_prob']:.2%})"
-                    else:
-                        comment_info['Тональность с вероятностью'] = "✅ Позитивный" if row[
-                                                                                           'comment_ton'] == 0 else "🔴 Токсичный"
-                else:
-                    comment_info['Тональность с вероятностью'] = "⏳ Не определен"
-
-                display_data.append(comment_info)
-                progress_bar.progress((idx + 1) / len(df))
+with tab1:
+    st.header("📋 Все комментарии")
 
-            progress_bar.empty()
-            status_text.empty()
+    # Курсоры (after_id) уже открытых страниц: следующие страницы подгружаются только по запросу
+    if 'page_cursors' not in st.session_state:
+        st.session_state.page_cursors = [0]
+        st.session_state.page = 0
 
-            df_display = pd.DataFrame(display_data)
+    try:
+        with st.spinner("Загрузка комментариев..."):
+            comments, next_after_id = get_comments_page(st.session_state.page_cursors[st.session_state.page])
+            summary = get_comments_summary()
+    except requests.exceptions.RequestException:
+        st.error("Ошибка загрузки")
+    else:
+        if comments:
+            df = pd.DataFrame(comments)
+            df_display = pd.DataFrame({
+                'ID': df['comment_id'],
+                'Текст комментария': df['comment_text'].where(df['comment_text'].str.len() <= 100,
+                                                             df['comment_text'].str[:100] + "..."),
+                'Тональность с вероятностью': [
+                    format_sentiment(ton, prob) for ton, prob in zip(df['comment_ton'], df['probability'])
+                ]
+            })
 
             st.dataframe(
-                df_display[['ID', 'Текст комментария', 'Тональность с вероятностью']],
+                df_display,
                 use_container_width=True,
                 column_config={
                     "ID": "ID",
@@ -87,25 +91,48 @@ with tab1:
                 }
             )
 
-            pending = len(df[df['comment_ton'].isna()])
+            col_prev, col_page, col_next = st.columns(3)
+            with col_prev:
+                if st.button("⬅️ Назад", disabled=st.session_state.page == 0, use_container_width=True):
+                    st.session_state.page -= 1
+                    st.rerun()
+            with col_page:
+                st.caption(f"Страница {st.session_state.page + 1} · всего комментариев: {summary['total']}")
+            with col_next:
+                if st.button("Далее ➡️", disabled=next_after_id is None, use_container_width=True):
+                    del st.session_state.page_cursors[st.session_state.page + 1:]
+                    st.session_state.page_cursors.append(next_after_id)
+                    st.session_state.page += 1
+                    st.rerun()
+
+            pending = summary['pending']
             if pending > 0:
                 st.info(f"📊 Необработанных комментариев: {pending}")
 
                 col1, col2, col3 = st.columns(3)
                 with col2:
                     if st.button("🧠 Проанализировать все", use_container_width=True):
-                        with st.spinner("Анализ комментариев..."):
-                            resp = requests.post(f"{API_URL}/predict/all")
-                            if resp.status_code == 200:
-                                st.success(f"✅ {resp.json()['message']}")
-                                st.cache_data.clear()
-                                st.rerun()
-                            else:
-                                st.error("❌ Ошибка анализа")
+                        resp = get_session().post(f"{API_URL}/predict/all")
+                        if resp.status_code == 202:
+                            st.session_state.job_id = resp.json()['job_id']
+                            st.success(f"✅ {resp.json()['message']}")
+                        else:
+                            st.error("❌ Ошибка анализа")
+
+            # Массовый анализ идёт на сервере в фоне, здесь только показываем его ход
+            if st.session_state.get('job_id'):
+                job = get_session().get(f"{API_URL}/jobs/{st.session_state.job_id}", timeout=10).json()
+                if job.get('status') in ('queued', 'running'):
+                    st.caption(f"⏳ Анализ: обработано {job['processed']} из {job['total'] or '…'}, "
+                               f"{job['rows_per_second'] or 0:.0f} строк/с")
+                    if st.button("🔄 Обновить"):
+                        st.rerun()
+                else:
+                    st.session_state.job_id = None
+                    st.cache_data.clear()
+                    st.rerun()
         else:
             st.warning("Нет комментариев")
-    else:
-        st.error("Ошибка загрузки")
 
 with tab2:
     st.header("✏️ Проверить тональность текста")
@@ -122,7 +149,7 @@ with tab2:
     if analyze_button and user_text:
         with st.spinner("Анализ текста..."):
             try:
-                response = requests.post(
+                response = get_session().post(
                     f"{API_URL}/predict/text",
                     params={"text": user_text},
                     timeout=10)
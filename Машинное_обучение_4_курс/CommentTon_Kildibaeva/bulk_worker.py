@@ -0,0 +1,181 @@
+"""Распределённый массовый анализ комментариев
+
+Любое число таких процессов (на одной или нескольких машинах) разбирает
+общую очередь неклассифицированных строк без пересечений: каждая порция
+захватывается в транзакции через SELECT ... FOR UPDATE SKIP LOCKED, поэтому
+другие обработчики её пропускают. Каждый обработчик идёт по comment_id от своего
+курсора и возвращается к началу таблицы, дойдя до конца. Результат записывается одним UPDATE и
+фиксируется в той же транзакции. Если процесс падает, MySQL закрывает его
+соединение, откатывает транзакцию и снимает блокировки — порцию забирает
+другой обработчик. Порция, которую не удалось обработать WORKER_MAX_CHUNK_FAILURES
+раз подряд, откладывается: этот обработчик её больше не захватывает.
+
+Нужен MySQL 8.0+ или MariaDB 10.6+ (SKIP LOCKED). Проверка на локальном сервере:
+    docker run -d -p 3306:3306 -e MARIADB_ROOT_PASSWORD=1234 -e MARIADB_DATABASE=db_comment mariadb:11
+    (создать таблицу comments и применить migrations/*.sql)
+    python bulk_worker.py & python bulk_worker.py & python bulk_worker.py
+Отсутствие повторной классификации несколькими обработчиками проверяет
+    COMMENTTON_TEST_MYSQL_DB=commentton_test python -m pytest tests/test_bulk_worker_mysql.py
+
+Запуск: python bulk_worker.py [chunk_size] [--follow]
+С --follow обработчик не завершается, когда очередь пуста, а ждёт новые строки.
+"""
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+
+from db import DB_CONFIG, ConnectionPool
+from classifier import MODEL_VERSION, PENDING_CONDITION, model, classify_rows, build_tons_update
+from preprocessing import LEMMA_CACHE_PATH, lemma_cache, warm_up_lemma_cache
+
+WORKER_CHUNK_SIZE = 500
+
+# Пауза перед повторной попыткой, когда все оставшиеся строки заняты другими обработчиками (с)
+WORKER_POLL_INTERVAL = 2.0
+
+# Сколько раз подряд повторять неудачную порцию, прежде чем отложить её строки до перезапуска обработчика
+WORKER_MAX_CHUNK_FAILURES = 3
+
+# READ COMMITTED: блокируются только подходящие строки, а не все просмотренные
+WORKER_DB_CONFIG = dict(DB_CONFIG, init_command="SET SESSION TRANSACTION ISOLATION LEVEL READ COMMITTED")
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+stop_event = threading.Event()
+
+
+def claim_chunk(conn, chunk_size, after_id=0):
+    """Начинает транзакцию и блокирует порцию строк после after_id, не занятых другими обработчиками
+
+    Выборка идёт по диапазону первичного ключа от курсора обработчика, поэтому
+    уже классифицированное начало таблицы не просматривается на каждой порции.
+    """
+    conn.begin()
+    with conn.cursor() as cursor:
+        cursor.execute(
+            f"SELECT comment_id, comment_text FROM comments WHERE comment_id > %s AND {PENDING_CONDITION} "
+            f"ORDER BY comment_id LIMIT %s FOR UPDATE SKIP LOCKED",
+            (after_id, MODEL_VERSION, chunk_size)
+        )
+        return cursor.fetchall()
+
+
+def has_pending(conn, skipped=()):
+    """Есть ли ещё неклассифицированные строки (в том числе занятые другими обработчиками) кроме отложенных"""
+    with conn.cursor() as cursor:
+        cursor.execute(
+            f"SELECT comment_id FROM comments WHERE {PENDING_CONDITION} ORDER BY comment_id LIMIT %s",
+            (MODEL_VERSION, len(skipped) + 1)
+        )
+        found = any(row['comment_id'] not in skipped for row in cursor.fetchall())
+    conn.commit()
+    return found
+
+
+def process_chunk(conn, rows):
+    """Классифицирует захваченную порцию и фиксирует результат, снимая блокировки"""
+    try:
+        results = classify_rows(rows)
+        query, params = build_tons_update(results)
+        with conn.cursor() as cursor:
+            cursor.execute(query, params)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def run(pool, chunk_size, follow=False):
+    processed = 0
+    errors = 0
+    # Курсор обработчика: последний захваченный comment_id; в конце таблицы сбрасывается в 0,
+    # чтобы подобрать строки, пропущенные из-за блокировок других обработчиков или добавленные позже
+    last_id = 0
+    # Обработаны ли строки с последнего возврата к началу таблицы
+    pass_processed = False
+    # comment_id отложенных после WORKER_MAX_CHUNK_FAILURES неудач строк: захватываются, но не обрабатываются
+    skipped = set()
+    failures = 0
+    started = time.perf_counter()
+    print(f"Обработчик {WORKER_ID} запущен: версия модели {MODEL_VERSION}, порция {chunk_size}")
+
+    while not stop_event.is_set():
+        rows = []
+        fresh = []
+        try:
+            with pool.connection() as conn:
+                rows = claim_chunk(conn, chunk_size, last_id)
+                fresh = [row for row in rows if row['comment_id'] not in skipped]
+                if fresh:
+                    process_chunk(conn, fresh)
+                else:
+                    conn.rollback()
+                    if not rows and not pass_processed:
+                        pending = has_pending(conn, skipped)
+        except Exception as e:
+            print(f"Ошибка обработчика {WORKER_ID}: {str(e)}")
+            errors += 1
+            if fresh:
+                failures += 1
+                if failures >= WORKER_MAX_CHUNK_FAILURES:
+                    print(f"Обработчик {WORKER_ID}: порция ID {fresh[0]['comment_id']}-{fresh[-1]['comment_id']} "
+                          f"отложена после {failures} неудачных попыток")
+                    skipped.update(row['comment_id'] for row in fresh)
+                    failures = 0
+            stop_event.wait(WORKER_POLL_INTERVAL)
+            continue
+        failures = 0
+
+        if not rows:
+            # Конец таблицы: после прохода с обработанными строками сразу начинаем новый с начала,
+            # иначе (остались только чужие или отложенные строки) ждём или завершаемся
+            if pass_processed:
+                last_id = 0
+                pass_processed = False
+                continue
+            if not pending and not follow:
+                break
+            last_id = 0
+            stop_event.wait(WORKER_POLL_INTERVAL)
+            continue
+
+        last_id = rows[-1]['comment_id']
+        if not fresh:
+            continue
+        pass_processed = True
+        processed += len(fresh)
+        rate = processed / (time.perf_counter() - started)
+        print(f"Обработчик {WORKER_ID}: ID {fresh[0]['comment_id']}-{fresh[-1]['comment_id']}, "
+              f"всего {processed} строк, {rate:.1f} строк/с")
+
+    print(f"Обработчик {WORKER_ID} завершён: {processed} строк, ошибок {errors}, отложено {len(skipped)}")
+    return processed
+
+
+def stop(signum, frame):
+    stop_event.set()
+
+
+if __name__ == '__main__':
+    if model is None:
+        raise SystemExit("Модель не загружена")
+
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    chunk_size = int(args[0]) if args else WORKER_CHUNK_SIZE
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    warm_up_lemma_cache(LEMMA_CACHE_PATH)
+    pool = ConnectionPool(WORKER_DB_CONFIG, pool_size=1, max_overflow=0)
+    try:
+        run(pool, chunk_size, follow='--follow' in sys.argv)
+    finally:
+        pool.close()
+        try:
+            lemma_cache.save(LEMMA_CACHE_PATH)
+        except Exception as e:
+            print(f"Не удалось сохранить кэш лемм: {str(e)}")
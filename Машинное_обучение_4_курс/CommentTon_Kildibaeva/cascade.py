@@ -0,0 +1,61 @@
+import threading
+
+import numpy as np
+from numpy_backend import LinearModel
+
+
+class Cascade:
+    """Двухуровневый классификатор: логистическая регрессия, затем основная сеть
+
+    Быстрая модель считает вероятность для всех текстов; в основную модель
+    уходят только тексты, чья вероятность попала в полосу неуверенности
+    (low, high). Веса и полоса по умолчанию сохраняются train_cascade.py.
+    """
+
+    def __init__(self, fast_model, low, high, source_digest=None):
+        if not 0 <= low <= high <= 1:
+            raise ValueError(f"Некорректная полоса неуверенности: ({low}, {high})")
+        self.fast_model = fast_model
+        self.low = float(low)
+        self.high = float(high)
+        # SHA-256 tfidf.pkl, на котором обучена быстрая модель
+        self.source_digest = source_digest
+        self.fast_rows = 0
+        self.full_rows = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path, band=None):
+        """Загружает модель из train_cascade.py; band=(low, high) заменяет сохранённую полосу"""
+        with np.load(path) as data:
+            fast_model = LinearModel(data['coef'], data['intercept'])
+            low, high = band if band is not None else (float(data['band_low']), float(data['band_high']))
+            source_digest = str(data['source_digest']) if 'source_digest' in data.files else None
+        return cls(fast_model, low, high, source_digest)
+
+    def uncertain(self, probabilities):
+        return (probabilities > self.low) & (probabilities < self.high)
+
+    def predict(self, matrix, full_predict):
+        """Вероятности для CSR-матрицы; full_predict вызывается только для неуверенных строк"""
+        probabilities = self.fast_model.predict_sparse(matrix)
+        uncertain = np.flatnonzero(self.uncertain(probabilities))
+        if len(uncertain):
+            probabilities[uncertain] = full_predict(matrix[uncertain])
+
+        with self._lock:
+            self.fast_rows += len(probabilities) - len(uncertain)
+            self.full_rows += len(uncertain)
+        return probabilities
+
+    def stats(self):
+        with self._lock:
+            fast_rows = self.fast_rows
+            full_rows = self.full_rows
+        total = fast_rows + full_rows
+        return {
+            "band": [self.low, self.high],
+            "fast_rows": fast_rows,
+            "full_rows": full_rows,
+            "full_share": full_rows / total if total else 0.0
+        }
@@ -0,0 +1,222 @@
+import hashlib
+import os
+import pickle
+import time
+
+import numpy as np
+from metrics import LATENCY_BUCKETS, StageTimer, registry
+from numpy_backend import NumpyModel
+from cascade import Cascade
+from vectorizer import FusedVectorizer
+from db import DB_CONFIG, ConnectionPool
+from prediction_cache import PredictionCache, PredictionCacheStore, text_key
+from preprocessing import preprocess_texts
+
+# Бэкенд инференса: 'keras' (TensorFlow) или 'numpy' (веса из export_weights.py, без TensorFlow)
+INFERENCE_BACKEND = os.environ.get('COMMENTTON_BACKEND', 'keras')
+KERAS_MODEL_PATH = 'model_1.keras'
+NUMPY_MODEL_PATH = 'model_1.npz'
+TFIDF_PATH = 'tfidf.pkl'
+
+# Сколько строк подаётся в модель за один проход при пакетном анализе
+PREDICT_CHUNK_SIZE = 256
+
+# Кэш предсказаний по хэшу предобработанного текста: размер в памяти и
+# включение постоянного уровня в таблице prediction_cache
+PREDICTION_CACHE_SIZE = 100000
+PREDICTION_CACHE_PERSISTENT = os.environ.get('COMMENTTON_PREDICTION_CACHE_TABLE', '0') == '1'
+
+# Каскад: логистическая регрессия из train_cascade.py отвечает сама, а в основную
+# модель уходят только тексты с вероятностью внутри полосы неуверенности.
+# COMMENTTON_CASCADE_BAND="0.2,0.8" заменяет полосу, подобранную при калибровке
+CASCADE_ENABLED = os.environ.get('COMMENTTON_CASCADE', '0') == '1'
+CASCADE_MODEL_PATH = 'model_fast.npz'
+CASCADE_BAND = os.environ.get('COMMENTTON_CASCADE_BAND')
+
+stage_seconds = registry.histogram('commentton_stage_seconds', 'Длительность этапов анализа',
+                                   LATENCY_BUCKETS, ('stage',))
+model_load_seconds = registry.gauge('commentton_model_load_seconds', 'Время загрузки компонентов модели',
+                                    ('component',))
+
+
+def stage(name):
+    """Таймер этапа анализа для /metrics: with stage('vectorize'): ..."""
+    return StageTimer(stage_seconds.labels(name))
+
+
+load_started = time.perf_counter()
+
+if INFERENCE_BACKEND == 'numpy':
+    try:
+        model = NumpyModel.load(NUMPY_MODEL_PATH)
+    except Exception as e:
+        print(f"Не удалось загрузить {NUMPY_MODEL_PATH}: {str(e)}")
+        model = None
+else:
+    try:
+        from tensorflow.keras.models import load_model
+        model = load_model(KERAS_MODEL_PATH)
+    except Exception as e:
+        model = None
+model_load_seconds.set('model', value=time.perf_counter() - load_started)
+
+load_started = time.perf_counter()
+try:
+    with open(TFIDF_PATH, 'rb') as f:
+        tfidf = pickle.load(f)
+except Exception as e:
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    tfidf = TfidfVectorizer(max_features=500, ngram_range=(1, 2))
+else:
+    # Словарь и idf обученного векторизатора переносятся в FusedVectorizer: результат
+    # тот же, что у tfidf.transform, а sklearn-объект не держится в памяти
+    try:
+        tfidf = FusedVectorizer.from_sklearn(tfidf)
+    except ValueError as e:
+        print(f"Используется TfidfVectorizer из sklearn: {str(e)}")
+model_load_seconds.set('tfidf', value=time.perf_counter() - load_started)
+
+
+def file_digest(path):
+    """SHA-256 содержимого файла (пустая строка, если файла нет)"""
+    try:
+        with open(path, 'rb') as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except OSError:
+        return ''
+
+
+cascade_model = None
+if CASCADE_ENABLED:
+    load_started = time.perf_counter()
+    try:
+        band = tuple(float(value) for value in CASCADE_BAND.split(',')) if CASCADE_BAND else None
+        cascade_model = Cascade.load(CASCADE_MODEL_PATH, band)
+        if cascade_model.source_digest and cascade_model.source_digest != file_digest(TFIDF_PATH):
+            raise ValueError("быстрая модель обучена на другом tfidf.pkl")
+    except Exception as e:
+        cascade_model = None
+        print(f"Не удалось загрузить каскад {CASCADE_MODEL_PATH}: {str(e)}")
+    model_load_seconds.set('cascade', value=time.perf_counter() - load_started)
+
+
+def get_model_version():
+    """Версия модели — короткий хэш весов сети, векторизатора и (если включён) каскада"""
+    if INFERENCE_BACKEND == 'numpy' and model is not None and model.source_digest:
+        model_digest = model.source_digest
+    elif INFERENCE_BACKEND == 'numpy':
+        model_digest = file_digest(NUMPY_MODEL_PATH)
+    else:
+        model_digest = file_digest(KERAS_MODEL_PATH)
+    if cascade_model is not None:
+        model_digest += file_digest(CASCADE_MODEL_PATH) + f"{cascade_model.low}:{cascade_model.high}"
+    return hashlib.sha256((model_digest + file_digest(TFIDF_PATH)).encode()).hexdigest()[:12]
+
+
+# Сохраняется вместе с результатом; строки с другой версией заново классифицирует /predict/all
+MODEL_VERSION = get_model_version()
+
+# Строки, которые нужно классифицировать: без тональности или с результатом другой версии модели
+PENDING_CONDITION = "(comment_ton IS NULL OR model_version IS NULL OR model_version <> %s)"
+
+prediction_cache_store = None
+if PREDICTION_CACHE_PERSISTENT:
+    prediction_cache_store = PredictionCacheStore(ConnectionPool(DB_CONFIG, pool_size=4, max_overflow=4),
+                                                  MODEL_VERSION)
+prediction_cache = PredictionCache(PREDICTION_CACHE_SIZE, prediction_cache_store)
+
+
+def predict_probabilities(processed_texts, chunk_size=PREDICT_CHUNK_SIZE, use_store=True):
+    """Вероятности токсичности с учётом кэша предсказаний
+
+    Повторяющиеся тексты (в том числе внутри одного пакета) прогоняются
+    через модель один раз; use_store=False обходит постоянный уровень кэша.
+    """
+    keys = [text_key(text) for text in processed_texts]
+    probabilities = np.empty(len(keys), dtype=np.float32)
+    with stage('cache'):
+        found = prediction_cache.get_many(keys, use_store)
+
+    missing = {}
+    for index, key in enumerate(keys):
+        probability = found.get(key)
+        if probability is None:
+            missing.setdefault(key, []).append(index)
+        else:
+            probabilities[index] = probability
+
+    if missing:
+        computed = compute_probabilities([processed_texts[indexes[0]] for indexes in missing.values()],
+                                         chunk_size)
+        prediction_cache.put_many(zip(missing, computed), use_store)
+        for indexes, probability in zip(missing.values(), computed):
+            probabilities[indexes] = probability
+    return probabilities
+
+
+def compute_probabilities(processed_texts, chunk_size=PREDICT_CHUNK_SIZE):
+    """Вероятности токсичности для списка предобработанных текстов (без кэша)
+
+    Векторизация выполняется одной разреженной матрицей; при включённом каскаде
+    в основную модель передаются только строки из полосы неуверенности.
+    """
+    with stage('vectorize'):
+        matrix = tfidf.transform(processed_texts)
+    if cascade_model is not None:
+        with stage('cascade'):
+            return cascade_model.predict(matrix, lambda rows: predict_full(rows, chunk_size))
+    return predict_full(matrix, chunk_size)
+
+
+def predict_full(matrix, chunk_size=PREDICT_CHUNK_SIZE):
+    """Проход основной модели по матрице TF-IDF частями размером chunk_size
+
+    Пакет не разворачивается в плотный вид целиком
+    (для бэкенда numpy матрица остаётся разреженной).
+    """
+    probabilities = np.empty(matrix.shape[0], dtype=np.float32)
+    for start in range(0, matrix.shape[0], chunk_size):
+        with stage('model'):
+            probabilities[start:start + chunk_size] = predict_matrix(matrix[start:start + chunk_size])
+    return probabilities
+
+
+def predict_matrix(matrix):
+    """Проход модели по разреженной матрице TF-IDF"""
+    if INFERENCE_BACKEND == 'numpy':
+        return model.predict_sparse(matrix)
+    return model.predict(matrix.toarray().astype(np.float32), verbose=0)[:, 0]
+
+
+def classify_rows(rows):
+    """Классифицирует порцию строк comments; возвращает тройки (comment_id, comment_ton, probability)"""
+    with stage('preprocess'):
+        processed_texts = preprocess_texts([row['comment_text'] for row in rows])
+    return classify_processed_rows(rows, processed_texts)
+
+
+def classify_processed_rows(rows, processed_texts):
+    """То же, что classify_rows, для уже предобработанных текстов"""
+    processed_texts = [text or "пустой комментарий" for text in processed_texts]
+    probabilities = predict_probabilities(processed_texts)
+    return [
+        (row['comment_id'], 1 if probability > 0.5 else 0, float(probability))
+        for row, probability in zip(rows, probabilities)
+    ]
+
+
+def build_tons_update(results):
+    """Запрос и параметры для записи результатов порции одним UPDATE ... CASE"""
+    cases = ' '.join(['WHEN %s THEN %s'] * len(results))
+    placeholders = ', '.join(['%s'] * len(results))
+    ids = [comment_id for comment_id, _, _ in results]
+    params = [value for comment_id, comment_ton, _ in results for value in (comment_id, comment_ton)]
+    params += [value for comment_id, _, probability in results for value in (comment_id, probability)]
+    params += [MODEL_VERSION] + ids
+    query = (
+        f"UPDATE comments SET comment_ton = CASE comment_id {cases} END, "
+        f"probability = CASE comment_id {cases} END, "
+        f"model_version = %s, classified_at = NOW() "
+        f"WHERE comment_id IN ({placeholders})"
+    )
+    return query, params
@@ -0,0 +1,161 @@
+"""Фоновый классификатор новых комментариев
+
+Следит за таблицей comments по отметке последнего обработанного comment_id,
+забирает новые строки без тональности (или с результатом другой версии модели)
+небольшими порциями и записывает результат одним UPDATE на порцию. Метки
+появляются через секунды после вставки, а нагрузка распределяется равномерно
+вместо пиков от массового анализа.
+
+Строка может появиться ниже отметки: транзакции с AUTO_INCREMENT фиксируются
+не по порядку, а /comments/bulk вставляет строки с явными comment_id. Поэтому
+при старте и затем раз в DAEMON_RESCAN_INTERVAL секунд таблица просматривается
+заново с начала (только неклассифицированные строки).
+
+Запуск: python classifier_daemon.py
+"""
+import json
+import signal
+import threading
+import time
+
+from db import DB_CONFIG, ConnectionPool
+from classifier import MODEL_VERSION, PENDING_CONDITION, model, classify_rows, build_tons_update
+from preprocessing import LEMMA_CACHE_PATH, lemma_cache, warm_up_lemma_cache
+
+# Размер порции и период опроса таблицы, когда новых строк нет (с)
+DAEMON_BATCH_SIZE = 64
+DAEMON_POLL_INTERVAL = 1.0
+
+# Ограничение скорости при разборе накопившегося хвоста (строк/с, 0 — без ограничения)
+DAEMON_MAX_ROWS_PER_SECOND = 500
+
+# Период повторного просмотра таблицы ниже отметки (с)
+DAEMON_RESCAN_INTERVAL = 300
+
+# Сколько раз подряд повторять неудачную порцию, прежде чем пропустить её до следующего просмотра
+DAEMON_MAX_RETRIES = 3
+
+# Файл с отметкой последнего обработанного comment_id
+DAEMON_STATE_PATH = 'classifier_daemon_state.json'
+
+stop_event = threading.Event()
+
+
+def load_watermark():
+    try:
+        with open(DAEMON_STATE_PATH, 'r', encoding='utf-8') as f:
+            return int(json.load(f)['last_id'])
+    except (OSError, ValueError, KeyError):
+        return 0
+
+
+def save_watermark(last_id):
+    with open(DAEMON_STATE_PATH, 'w', encoding='utf-8') as f:
+        json.dump({"last_id": last_id}, f)
+
+
+def fetch_pending_rows(conn, last_id, limit):
+    """Следующая порция неклассифицированных текущей моделью комментариев после last_id"""
+    with conn.cursor() as cursor:
+        cursor.execute(
+            f"SELECT comment_id, comment_text FROM comments "
+            f"WHERE comment_id > %s AND {PENDING_CONDITION} ORDER BY comment_id LIMIT %s",
+            (last_id, MODEL_VERSION, limit)
+        )
+        rows = cursor.fetchall()
+    # Закрываем снимок транзакции, иначе следующий опрос не увидит новые строки
+    conn.commit()
+    return rows
+
+
+def process_batch(conn, rows):
+    """Классифицирует порцию и записывает результат одной транзакцией"""
+    results = classify_rows(rows)
+    query, params = build_tons_update(results)
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(query, params)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def run(pool):
+    # high_id — сохраняемая отметка (наибольший обработанный comment_id), last_id — курсор текущего просмотра
+    high_id = load_watermark()
+    last_id = high_id
+    # Первый повторный просмотр — сразу, как только хвост после отметки разобран
+    rescan_at = time.monotonic()
+    failures = 0
+    print(f"Классификатор запущен: версия модели {MODEL_VERSION}, отметка {high_id}")
+
+    while not stop_event.is_set():
+        started = time.perf_counter()
+        rows = []
+        try:
+            with pool.connection() as conn:
+                rows = fetch_pending_rows(conn, last_id, DAEMON_BATCH_SIZE)
+                if rows:
+                    process_batch(conn, rows)
+        except Exception as e:
+            print(f"Ошибка классификатора после ID {last_id}: {str(e)}")
+            if rows:
+                failures += 1
+                if failures >= DAEMON_MAX_RETRIES:
+                    # Порция останется неклассифицированной и будет повторена при следующем просмотре
+                    print(f"Порция ID {rows[0]['comment_id']}-{rows[-1]['comment_id']} пропущена "
+                          f"после {failures} неудачных попыток")
+                    failures = 0
+                    last_id = rows[-1]['comment_id']
+                    if last_id > high_id:
+                        high_id = last_id
+                        save_watermark(high_id)
+            stop_event.wait(DAEMON_POLL_INTERVAL)
+            continue
+        failures = 0
+
+        if not rows:
+            if last_id < high_id:
+                # Повторный просмотр дошёл до отметки — дальше снова только новые строки
+                last_id = high_id
+            elif time.monotonic() >= rescan_at:
+                last_id = 0
+                rescan_at = time.monotonic() + DAEMON_RESCAN_INTERVAL
+                continue
+            stop_event.wait(DAEMON_POLL_INTERVAL)
+            continue
+
+        last_id = rows[-1]['comment_id']
+        if last_id > high_id:
+            high_id = last_id
+            save_watermark(high_id)
+        elapsed = time.perf_counter() - started
+        print(f"Классифицировано {len(rows)} строк до ID {last_id} за {elapsed * 1000:.0f} мс")
+
+        if DAEMON_MAX_ROWS_PER_SECOND > 0:
+            stop_event.wait(max(0.0, len(rows) / DAEMON_MAX_ROWS_PER_SECOND - elapsed))
+
+
+def stop(signum, frame):
+    stop_event.set()
+
+
+if __name__ == '__main__':
+    if model is None:
+        raise SystemExit("Модель не загружена")
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    warm_up_lemma_cache(LEMMA_CACHE_PATH)
+    pool = ConnectionPool(DB_CONFIG, pool_size=1, max_overflow=0)
+    try:
+        run(pool)
+    finally:
+        pool.close()
+        try:
+            lemma_cache.save(LEMMA_CACHE_PATH)
+        except Exception as e:
+            print(f"Не удалось сохранить кэш лемм: {str(e)}")
+        print("Классификатор остановлен")
@@ -0,0 +1,244 @@
+import asyncio
+import queue
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+
+import aiomysql
+import pymysql
+import pymysql.cursors
+from metrics import Histogram
+
+# Параметры подключения к MySQL, общие для сервиса и фоновых обработчиков
+DB_CONFIG = {
+    'host': 'localhost',
+    'user': 'root',
+    'password': '1234',
+    'database': 'db_comment',
+    'charset': 'utf8mb4',
+    'cursorclass': pymysql.cursors.DictCursor
+}
+
+
+class PoolTimeout(Exception):
+    """Свободное соединение не появилось за отведённое время"""
+
+
+class ConnectionPool:
+    """Ограниченный потокобезопасный пул соединений pymysql
+
+    Держит до pool_size простаивающих соединений и открывает ещё до max_overflow
+    сверх них под пиковую нагрузку (такие соединения закрываются при возврате).
+    При выдаче соединение проверяется ping'ом, а прожившее дольше max_lifetime
+    секунд пересоздаётся.
+    """
+
+    def __init__(self, config, pool_size=10, max_overflow=10, timeout=5.0, max_lifetime=1800, health_check=True):
+        self.config = config
+        self.pool_size = pool_size
+        self.max_overflow = max_overflow
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.health_check = health_check
+
+        self.checkouts = 0
+        self.timeouts = 0
+        self.discarded = 0
+        self.wait_ms = Histogram([0.1, 0.5, 1, 5, 10, 50, 100, 500, 1000, 5000])
+
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(pool_size + max_overflow)
+        self._lock = threading.Lock()
+        self._open = 0
+        self._in_use = 0
+
+    def _connect(self):
+        conn = pymysql.connect(**self.config)
+        with self._lock:
+            self._open += 1
+        return conn, time.monotonic()
+
+    def _discard(self, conn):
+        with self._lock:
+            self._open -= 1
+            self.discarded += 1
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _is_usable(self, conn, created):
+        if time.monotonic() - created > self.max_lifetime:
+            return False
+        if self.health_check:
+            try:
+                conn.ping(reconnect=False)
+            except Exception:
+                return False
+        return True
+
+    def acquire(self):
+        """Выдаёт пару (соединение, время создания), ожидая не дольше timeout"""
+        started = time.perf_counter()
+        if not self._slots.acquire(timeout=self.timeout):
+            with self._lock:
+                self.timeouts += 1
+            raise PoolTimeout(f"Нет свободных соединений с БД за {self.timeout} с")
+        self.wait_ms.observe((time.perf_counter() - started) * 1000)
+
+        try:
+            while True:
+                try:
+                    conn, created = self._idle.get_nowait()
+                except queue.Empty:
+                    conn, created = self._connect()
+                    break
+                if self._is_usable(conn, created):
+                    break
+                self._discard(conn)
+        except Exception:
+            self._slots.release()
+            raise
+
+        with self._lock:
+            self.checkouts += 1
+            self._in_use += 1
+        return conn, created
+
+    def release(self, conn, created, broken=False):
+        """Возвращает соединение в пул; сломанные и лишние соединения закрываются"""
+        try:
+            keep = not broken and self._idle.qsize() < self.pool_size \
+                and time.monotonic() - created <= self.max_lifetime
+            if keep:
+                try:
+                    # Незавершённая транзакция не должна достаться следующему запросу
+                    conn.rollback()
+                except Exception:
+                    keep = False
+            if keep:
+                self._idle.put((conn, created))
+            else:
+                self._discard(conn)
+        finally:
+            with self._lock:
+                self._in_use -= 1
+            self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        conn, created = self.acquire()
+        broken = False
+        try:
+            yield conn
+        except (pymysql.err.OperationalError, pymysql.err.InterfaceError):
+            broken = True
+            raise
+        finally:
+            self.release(conn, created, broken)
+
+    def close(self):
+        """Закрывает все простаивающие соединения"""
+        while True:
+            try:
+                conn, _ = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
+
+    def stats(self):
+        with self._lock:
+            open_connections = self._open
+            in_use = self._in_use
+        return {
+            "pool_size": self.pool_size,
+            "max_overflow": self.max_overflow,
+            "open": open_connections,
+            "in_use": in_use,
+            "idle": self._idle.qsize(),
+            "overflow": max(0, open_connections - self.pool_size),
+            "checkouts": self.checkouts,
+            "timeouts": self.timeouts,
+            "discarded": self.discarded,
+            "wait_ms": self.wait_ms.snapshot()
+        }
+
+
+class AsyncConnectionPool:
+    """Пул соединений aiomysql для асинхронных обработчиков
+
+    Те же настройки, что у ConnectionPool: всего не больше pool_size + max_overflow
+    соединений, ping при выдаче, пересоздание соединений старше max_lifetime
+    и ожидание свободного соединения не дольше timeout секунд.
+    Пул создаётся при старте приложения методом open.
+    """
+
+    def __init__(self, config, pool_size=10, max_overflow=10, timeout=5.0, max_lifetime=1800, health_check=True):
+        self.config = config
+        self.pool_size = pool_size
+        self.max_overflow = max_overflow
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.health_check = health_check
+
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_ms = Histogram([0.1, 0.5, 1, 5, 10, 50, 100, 500, 1000, 5000])
+
+        self._pool = None
+
+    async def open(self):
+        self._pool = await aiomysql.create_pool(
+            minsize=0,
+            maxsize=self.pool_size + self.max_overflow,
+            pool_recycle=self.max_lifetime,
+            **self.config
+        )
+
+    async def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            await self._pool.wait_closed()
+            self._pool = None
+
+    @asynccontextmanager
+    async def connection(self):
+        started = time.perf_counter()
+        try:
+            conn = await asyncio.wait_for(self._pool.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise PoolTimeout(f"Нет свободных соединений с БД за {self.timeout} с")
+        self.wait_ms.observe((time.perf_counter() - started) * 1000)
+        self.checkouts += 1
+
+        try:
+            if self.health_check:
+                await conn.ping(reconnect=True)
+            yield conn
+        except (pymysql.err.OperationalError, pymysql.err.InterfaceError):
+            conn.close()
+            raise
+        finally:
+            if not conn.closed and conn.get_transaction_status():
+                # aiomysql закрывает соединения с открытой транзакцией вместо возврата в пул
+                try:
+                    await conn.rollback()
+                except Exception:
+                    conn.close()
+            self._pool.release(conn)
+
+    def stats(self):
+        size = self._pool.size if self._pool is not None else 0
+        idle = self._pool.freesize if self._pool is not None else 0
+        return {
+            "pool_size": self.pool_size,
+            "max_overflow": self.max_overflow,
+            "open": size,
+            "in_use": size - idle,
+            "idle": idle,
+            "overflow": max(0, size - self.pool_size),
+            "checkouts": self.checkouts,
+            "timeouts": self.timeouts,
+            "wait_ms": self.wait_ms.snapshot()
+        }
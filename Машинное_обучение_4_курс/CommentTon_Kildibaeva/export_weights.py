@@ -0,0 +1,85 @@
+"""Экспорт весов model_1.keras в model_1.npz для NumPy-бэкенда
+
+Запуск: python export_weights.py [model_1.keras] [model_1.npz]
+"""
+import sys
+import hashlib
+import numpy as np
+import scipy.sparse as sp
+from tensorflow.keras.models import load_model
+from tensorflow.keras.layers import Activation, Dense, Dropout, InputLayer
+from numpy_backend import ACTIVATIONS, NumpyModel
+
+TOLERANCE = 1e-5
+
+
+# Слои без весов, которые при инференсе ничего не делают
+INFERENCE_NOOP_LAYERS = (Dropout, InputLayer)
+
+
+def export_weights(model_path, output_path):
+    model = load_model(model_path)
+
+    kernels = []
+    biases = []
+    activations = []
+    for layer in model.layers:
+        if isinstance(layer, INFERENCE_NOOP_LAYERS):
+            continue
+        if isinstance(layer, Activation):
+            if not kernels:
+                raise ValueError(f"Слой {layer.name}: активация до первого Dense не поддерживается")
+            activation = layer.activation.__name__
+            if activations[-1] == 'linear':
+                activations[-1] = activation
+            else:
+                # У предыдущего Dense уже есть своя активация — добавляется тождественный слой
+                width = kernels[-1].shape[1]
+                kernels.append(np.eye(width, dtype=np.float32))
+                biases.append(np.zeros(width, dtype=np.float32))
+                activations.append(activation)
+            continue
+        if not isinstance(layer, Dense):
+            raise ValueError(f"Слой {layer.name} ({type(layer).__name__}) не поддерживается")
+        weights = layer.get_weights()
+        kernel = weights[0]
+        bias = weights[1] if layer.use_bias else np.zeros(kernel.shape[1], dtype=np.float32)
+        kernels.append(kernel.astype(np.float32))
+        biases.append(bias.astype(np.float32))
+        activations.append(layer.activation.__name__)
+
+    unknown = [name for name in activations if name not in ACTIVATIONS]
+    if unknown:
+        raise ValueError(f"Функции активации не поддерживаются NumPy-бэкендом: {unknown}")
+
+    arrays = {}
+    for index, (kernel, bias) in enumerate(zip(kernels, biases)):
+        arrays[f'kernel_{index}'] = kernel
+        arrays[f'bias_{index}'] = bias
+
+    with open(model_path, 'rb') as f:
+        source_digest = hashlib.sha256(f.read()).hexdigest()
+
+    np.savez(output_path, activations=np.array(activations), source_digest=np.array(source_digest), **arrays)
+    return model
+
+
+def check_export(model, output_path, n_rows=256):
+    """Сравнивает вероятности Keras и NumPy на случайных разреженных строках"""
+    numpy_model = NumpyModel.load(output_path)
+    matrix = sp.random(n_rows, numpy_model.input_dim, density=0.01, format='csr',
+                       dtype=np.float32, random_state=42)
+    expected = model.predict(matrix.toarray(), verbose=0)[:, 0]
+    actual = numpy_model.predict_sparse(matrix)
+    return float(np.max(np.abs(expected - actual)))
+
+
+if __name__ == '__main__':
+    model_path = sys.argv[1] if len(sys.argv) > 1 else 'model_1.keras'
+    output_path = sys.argv[2] if len(sys.argv) > 2 else 'model_1.npz'
+
+    keras_model = export_weights(model_path, output_path)
+    max_diff = check_export(keras_model, output_path)
+    print(f"Веса сохранены в {output_path}, максимальное расхождение с Keras: {max_diff:.2e}")
+    if max_diff > TOLERANCE:
+        sys.exit(f"Расхождение превышает допуск {TOLERANCE}")
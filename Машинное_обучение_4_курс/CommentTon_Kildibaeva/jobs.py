@@ -0,0 +1,195 @@
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+# Задача со статусом running без обновлений дольше этого времени (с) считается брошенной
+# (процесс сервиса упал) и уступает очередь следующей
+JOB_STALE_SECONDS = 300
+# Как часто (с) выполняющая задачу служба подтверждает, что жива, независимо от длительности порции
+JOB_HEARTBEAT_INTERVAL = 30
+
+
+class JobLost(Exception):
+    """Задача признана брошенной и больше не принадлежит этому обработчику"""
+
+
+class JobStore:
+    """Очередь задач массового анализа в локальной базе SQLite
+
+    Одновременно выполняется не больше одной задачи: захват задачи и проверка,
+    что других выполняющихся нет, делаются одним UPDATE, поэтому это правило
+    соблюдается и между несколькими процессами сервиса на одной машине.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "job_id TEXT PRIMARY KEY, "
+                "status TEXT NOT NULL, "
+                "params TEXT NOT NULL, "
+                "created_at REAL NOT NULL, "
+                "started_at REAL, "
+                "finished_at REAL, "
+                "heartbeat_at REAL, "
+                "worker TEXT, "
+                "total INTEGER, "
+                "processed INTEGER NOT NULL DEFAULT 0, "
+                "errors INTEGER NOT NULL DEFAULT 0, "
+                "rows_per_second REAL, "
+                "last_id INTEGER, "
+                "cancel_requested INTEGER NOT NULL DEFAULT 0, "
+                "error TEXT)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at)")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _to_dict(row):
+        if row is None:
+            return None
+        job = dict(row)
+        job['params'] = json.loads(job['params'])
+        job['cancel_requested'] = bool(job['cancel_requested'])
+        return job
+
+    def create(self, params):
+        job_id = uuid.uuid4().hex
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (job_id, status, params, created_at) VALUES (?, 'queued', ?, ?)",
+                (job_id, json.dumps(params), time.time())
+            )
+        return self.get(job_id)
+
+    def get(self, job_id):
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return self._to_dict(row)
+
+    def claim_next(self, worker):
+        """Переводит самую старую задачу из очереди в running, если других выполняющихся нет"""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "UPDATE jobs SET status = 'failed', finished_at = ?, error = 'Обработчик задачи перестал отвечать' "
+                "WHERE status = 'running' AND heartbeat_at < ?",
+                (now, now - JOB_STALE_SECONDS)
+            )
+            cursor = conn.execute(
+                "UPDATE jobs SET status = 'running', started_at = ?, heartbeat_at = ?, worker = ? "
+                "WHERE job_id = (SELECT job_id FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1) "
+                "AND NOT EXISTS (SELECT 1 FROM jobs WHERE status = 'running')",
+                (now, now, worker)
+            )
+            row = None
+            if cursor.rowcount:
+                row = conn.execute(
+                    "SELECT * FROM jobs WHERE status = 'running' AND worker = ?", (worker,)
+                ).fetchone()
+            conn.execute("COMMIT")
+        return self._to_dict(row)
+
+    def heartbeat(self, job_id, worker):
+        """Обновляет heartbeat_at; возвращает False, если задача уже не выполняется этим обработчиком"""
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET heartbeat_at = ? WHERE job_id = ? AND worker = ? AND status = 'running'",
+                (time.time(), job_id, worker)
+            )
+        return cursor.rowcount > 0
+
+    def update_progress(self, job_id, worker, total, processed, errors, rows_per_second, last_id):
+        """Сохраняет прогресс; возвращает True, если задачу попросили отменить
+
+        Если задачу тем временем признали брошенной, бросает JobLost: обработчик
+        должен остановиться, чтобы не работать параллельно со следующей задачей.
+        """
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET total = ?, processed = ?, errors = ?, rows_per_second = ?, last_id = ?, "
+                "heartbeat_at = ? WHERE job_id = ? AND worker = ? AND status = 'running'",
+                (total, processed, errors, rows_per_second, last_id, time.time(), job_id, worker)
+            )
+            if not cursor.rowcount:
+                raise JobLost(job_id)
+            row = conn.execute("SELECT cancel_requested FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return bool(row and row['cancel_requested'])
+
+    def finish(self, job_id, worker, status, error=None):
+        """Завершает задачу, если она всё ещё выполняется этим обработчиком"""
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, finished_at = ?, error = ? "
+                "WHERE job_id = ? AND worker = ? AND status = 'running'",
+                (status, time.time(), error, job_id, worker)
+            )
+
+    def requeue(self, job_id, worker):
+        """Возвращает прерванную задачу в очередь (продолжится с сохранённой отметки)"""
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'queued', worker = NULL "
+                "WHERE job_id = ? AND worker = ? AND status = 'running'",
+                (job_id, worker)
+            )
+
+    def cancel(self, job_id):
+        """Отменяет задачу из очереди сразу, а выполняющуюся — после текущей порции"""
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'cancelled', finished_at = ? WHERE job_id = ? AND status = 'queued'",
+                (time.time(), job_id)
+            )
+            conn.execute(
+                "UPDATE jobs SET cancel_requested = 1 WHERE job_id = ? AND status = 'running'",
+                (job_id,)
+            )
+        return self.get(job_id)
+
+
+class JobHeartbeat:
+    """Поток, обновляющий heartbeat_at выполняющейся задачи раз в interval секунд
+
+    Долгая порция (или занятый цикл событий) не делает задачу брошенной, пока
+    процесс жив; если владение задачей потеряно, lost становится True.
+    """
+
+    def __init__(self, store, job_id, worker, interval=JOB_HEARTBEAT_INTERVAL):
+        self.store = store
+        self.job_id = job_id
+        self.worker = worker
+        self.interval = interval
+        self.lost = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f'job-heartbeat-{job_id}', daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                if not self.store.heartbeat(self.job_id, self.worker):
+                    self.lost = True
+                    return
+            except sqlite3.Error as e:
+                print(f"Не удалось обновить heartbeat задачи {self.job_id}: {str(e)}")
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
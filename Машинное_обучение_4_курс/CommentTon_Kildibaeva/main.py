@@ -1,129 +1,133 @@
-from fastapi import FastAPI, HTTPException
-from typing import List, Optional
-import pandas as pd
-import numpy as np
-import re
-import string
-import pymysql
-import pymysql.cursors
-from contextlib import contextmanager
-from tensorflow.keras.models import load_model
-import pickle
-import nltk
-from nltk.corpus import stopwords
-import pymorphy3
+from fastapi import FastAPI, HTTPException, Request, Query, Response
+from fastapi.responses import StreamingResponse, PlainTextResponse
+from typing import List, Optional, Union, Literal
+import os
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import aiomysql
+import json
+import csv
+import socket
+from datetime import datetime
 import warnings
 from pydantic import BaseModel
+from metrics import PrometheusMiddleware, registry
+from microbatcher import MicroBatcher
+from db import DB_CONFIG, AsyncConnectionPool
+from classifier import (MODEL_VERSION, PREDICT_CHUNK_SIZE, model, tfidf, predict_probabilities,
+                        classify_rows, classify_processed_rows, build_tons_update, PENDING_CONDITION,
+                        prediction_cache, prediction_cache_store, cascade_model, stage)
+from prediction_cache import text_key
+from jobs import JobHeartbeat, JobLost, JobStore
+from preprocessing import (LEMMA_CACHE_PATH, PREPROCESS_CHUNK_SIZE, lemma_cache, warm_up_lemma_cache,
+                           preprocess_text, preprocess_texts, create_preprocess_pool,
+                           preprocess_texts_parallel_async)
 
 warnings.filterwarnings('ignore')
 
-DB_CONFIG = {
-    'host': 'localhost',
-    'user': 'root',
-    'password': '1234',
-    'database': 'db_comment',
-    'charset': 'utf8mb4',
-    'cursorclass': pymysql.cursors.DictCursor
+# Те же параметры для асинхронного драйвера aiomysql
+ASYNC_DB_CONFIG = {
+    'host': DB_CONFIG['host'],
+    'user': DB_CONFIG['user'],
+    'password': DB_CONFIG['password'],
+    'db': DB_CONFIG['database'],
+    'charset': DB_CONFIG['charset'],
+    'cursorclass': aiomysql.DictCursor
 }
 
-app = FastAPI()
-
-try:
-    model = load_model('model_1.keras')
-except Exception as e:
-    model = None
+# Пул соединений с БД: постоянные соединения, дополнительные под пики,
+# ожидание свободного соединения (с) и максимальное время жизни соединения (с)
+DB_POOL_SIZE = 10
+DB_POOL_MAX_OVERFLOW = 10
+DB_POOL_TIMEOUT = 5
+DB_POOL_MAX_LIFETIME = 1800
 
-try:
-    with open('tfidf.pkl', 'rb') as f:
-        tfidf = pickle.load(f)
-except Exception as e:
-    from sklearn.feature_extraction.text import TfidfVectorizer
-    tfidf = TfidfVectorizer(max_features=500, ngram_range=(1, 2))
+# Потоки под предобработку и инференс (по умолчанию — по числу ядер)
+INFERENCE_WORKERS = os.cpu_count() or 4
 
-morph = pymorphy3.MorphAnalyzer(lang='ru')
-russian_stopwords = stopwords.words("russian")
-russian_stopwords.extend(['т.д.', 'т', 'д', 'это', 'который', 'которые', 'которых', 'свой', 'своём', 'всем', 'всё',
-                          'её', 'оба', 'ещё', 'должный', 'должные', 'должных'])
+# Массовая предобработка в пуле процессов (0 — выключено, предобработка в потоках инференса)
+PREPROCESS_PROCESSES = int(os.environ.get('COMMENTTON_PREPROCESS_PROCESSES', 0))
 
-st = '\xa0—'
-custom_punctuation = string.punctuation + '«»'
+# Постраничная выдача GET /comments: размер страницы по умолчанию и максимальный
+COMMENTS_PAGE_SIZE = 100
+COMMENTS_MAX_PAGE_SIZE = 1000
 
+# Сколько секунд отдавать GET /comments/summary из памяти, не пересчитывая GROUP BY по таблице
+COMMENTS_SUMMARY_TTL = 30
 
-def remove_othersymbol(text):
-    """Удаляет специальные символы"""
-    return ''.join([ch if ch not in st else ' ' for ch in text])
+# Загрузка POST /comments/bulk: строк в одном INSERT и сколько ошибок перечислять в ответе
+BULK_INSERT_BATCH_SIZE = 1000
+# Наибольший batch_size: с classify=true на строку приходится 5 параметров, а MySQL
+# принимает не больше 65535 плейсхолдеров в одном запросе
+BULK_INSERT_MAX_BATCH_SIZE = 10000
+BULK_MAX_REPORTED_ERRORS = 100
 
+# Массовый анализ: размер порции и файл с отметкой последнего обработанного comment_id
+PREDICT_ALL_CHUNK_SIZE = 500
+PREDICT_ALL_STATE_PATH = 'predict_all_state.json'
 
-def remove_punctuation(text):
-    """Удаляет пунктуацию"""
-    return ''.join([ch for ch in text if ch not in custom_punctuation])
+# Очередь задач массового анализа: файл SQLite и период опроса очереди (с)
+JOBS_DB_PATH = 'jobs.db'
+JOB_POLL_INTERVAL = 2
 
+app = FastAPI()
+app.add_middleware(PrometheusMiddleware, registry=registry, prefix='commentton')
 
-def remove_numbers(text):
-    """Удаляет цифры"""
-    return ''.join([i if not i.isdigit() else ' ' for i in text])
+# Отсчёт времени запуска после импорта моделей (их загрузка — commentton_model_load_seconds)
+INIT_STARTED = time.perf_counter()
 
+warm_up_lemma_cache(LEMMA_CACHE_PATH)
+preprocess_pool = None
 
-def remove_multiple_spaces(text):
-    """Удаляет множественные пробелы"""
-    return re.sub(r'\s+', ' ', text, flags=re.I)
 
+batcher = MicroBatcher(predict_probabilities)
 
-def remove_stopwords(text):
-    """Удаляет стоп-слова"""
-    if not isinstance(text, str):
-        return text
-    words = text.split()
-    filtered_words = [word for word in words if word.lower() not in russian_stopwords]
-    return ' '.join(filtered_words)
 
+async def predict_single(processed_text):
+    """Вероятность для одного текста: из кэша в памяти или через микробатчинг"""
+    probability = prediction_cache.peek(text_key(processed_text))
+    if probability is None:
+        with stage('microbatch'):
+            probability = await batcher.predict_async(processed_text)
+    return probability
 
-def lemmatize_text(text):
-    """Лемматизация текста"""
-    if not isinstance(text, str) or not text.strip():
-        return text
 
-    words = text.split()
-    lemmatized = []
-    for word in words:
-        try:
-            p = morph.parse(word)[0]
-            lemmatized.append(p.normal_form)
-        except:
-            lemmatized.append(word)
-    return ' '.join(lemmatized)
+def timed_preprocess_text(text):
+    with stage('preprocess'):
+        return preprocess_text(text)
 
 
-def preprocess_text(text):
-    """Полный цикл предобработки текста"""
-    if not isinstance(text, str) or not text.strip():
-        return ""
+job_store = JobStore(JOBS_DB_PATH)
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+job_wakeup = asyncio.Event()
+job_worker_task = None
 
-    text = text.lower()
-    text = remove_othersymbol(text)
-    text = remove_punctuation(text)
-    text = remove_numbers(text)
-    text = remove_multiple_spaces(text)
-    text = remove_stopwords(text)
-    text = lemmatize_text(text)
+db_pool = AsyncConnectionPool(ASYNC_DB_CONFIG, pool_size=DB_POOL_SIZE, max_overflow=DB_POOL_MAX_OVERFLOW,
+                              timeout=DB_POOL_TIMEOUT, max_lifetime=DB_POOL_MAX_LIFETIME)
 
-    return text.strip()
+# Отдельный пул потоков под предобработку и инференс, чтобы CPU-нагрузка
+# не занимала потоки, обслуживающие остальные запросы
+inference_executor = ThreadPoolExecutor(max_workers=INFERENCE_WORKERS, thread_name_prefix="inference")
 
 
-@contextmanager
 def get_db_connection():
-    """Контекстный менеджер для подключения к БД"""
-    conn = pymysql.connect(**DB_CONFIG)
-    try:
-        yield conn
-    finally:
-        conn.close()
+    """Асинхронный контекстный менеджер для подключения к БД (соединение берётся из пула)"""
+    return db_pool.connection()
+
+
+async def run_cpu_bound(func, *args):
+    """Выполняет функцию в пуле потоков инференса"""
+    return await asyncio.get_running_loop().run_in_executor(inference_executor, func, *args)
 
 
 class Comment(BaseModel):
     comment_id: int
     comment_text: str
     comment_ton: Optional[int] = None
+    probability: Optional[float] = None
+    model_version: Optional[str] = None
+    classified_at: Optional[datetime] = None
 
 
 class SentimentResponse(BaseModel):
@@ -141,57 +145,450 @@ class TextPredictionResponse(BaseModel):
     confidence: float
 
 
+class JobResponse(BaseModel):
+    job_id: str
+    status: str
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    total: Optional[int] = None
+    processed: int = 0
+    errors: int = 0
+    rows_per_second: Optional[float] = None
+    last_id: Optional[int] = None
+    cancel_requested: bool = False
+    error: Optional[str] = None
+
+
+class TextItem(BaseModel):
+    id: Union[int, str]
+    text: str
+
+
+class BatchTextPredictionResponse(TextPredictionResponse):
+    id: Union[int, str]
+
+
+@app.on_event("shutdown")
+def save_lemma_cache():
+    """Сохраняет кэш лемм для быстрого старта следующего запуска"""
+    try:
+        lemma_cache.save(LEMMA_CACHE_PATH)
+    except Exception as e:
+        print(f"Не удалось сохранить кэш лемм: {str(e)}")
+
+
+@app.on_event("startup")
+async def open_db_pool():
+    await db_pool.open()
+
+
+@app.on_event("startup")
+async def purge_prediction_cache():
+    """Удаляет из постоянного кэша предсказания прежних версий модели"""
+    if prediction_cache_store is None:
+        return
+    try:
+        deleted = await asyncio.to_thread(prediction_cache_store.purge_other_versions)
+        print(f"Кэш предсказаний: удалено {deleted} записей прежних версий модели")
+    except Exception as e:
+        print(f"Не удалось очистить кэш предсказаний: {str(e)}")
+
+
+@app.on_event("startup")
+def start_preprocess_pool():
+    global preprocess_pool
+    if PREPROCESS_PROCESSES > 0:
+        preprocess_pool = create_preprocess_pool(PREPROCESS_PROCESSES)
+
+
+@app.on_event("shutdown")
+def stop_preprocess_pool():
+    if preprocess_pool is not None:
+        preprocess_pool.shutdown(wait=True, cancel_futures=True)
+
+
+@app.on_event("shutdown")
+async def close_db_pool():
+    await db_pool.close()
+    inference_executor.shutdown(wait=False)
+
+
+registry.register('commentton_microbatch_batch_size', 'Размер пакета микробатчинга', batcher.batch_sizes)
+registry.register('commentton_microbatch_queue_wait_milliseconds', 'Ожидание запроса в очереди микробатчинга',
+                  batcher.queue_wait_ms)
+registry.register('commentton_db_pool_wait_milliseconds', 'Ожидание свободного соединения с БД', db_pool.wait_ms)
+registry.gauge_callback('commentton_db_pool_in_use', 'Занятые соединения пула БД',
+                        lambda: db_pool.stats()['in_use'])
+registry.counter_callback('commentton_lemma_cache_hits_total', 'Попадания в кэш лемм', lambda: lemma_cache.hits)
+registry.counter_callback('commentton_lemma_cache_misses_total', 'Промахи кэша лемм', lambda: lemma_cache.misses)
+registry.counter_callback('commentton_prediction_cache_hits_total', 'Попадания в кэш предсказаний (память и таблица)',
+                          lambda: prediction_cache.hits + prediction_cache.store_hits)
+registry.counter_callback('commentton_prediction_cache_misses_total', 'Промахи кэша предсказаний',
+                          lambda: prediction_cache.misses)
+if cascade_model is not None:
+    registry.counter_callback('commentton_cascade_fast_rows_total', 'Строки, классифицированные быстрым уровнем каскада',
+                              lambda: cascade_model.fast_rows)
+    registry.counter_callback('commentton_cascade_full_rows_total', 'Строки, переданные основной модели каскада',
+                              lambda: cascade_model.full_rows)
+startup_seconds = registry.gauge('commentton_startup_seconds', 'Время запуска сервиса после загрузки моделей')
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Метрики сервиса в текстовом формате Prometheus"""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/stats")
+async def get_stats():
+    """Статистика кэшей, микробатчинга и пула соединений сервиса"""
+    return {
+        "model_version": MODEL_VERSION,
+        "lemma_cache": lemma_cache.stats(),
+        "prediction_cache": prediction_cache.stats(),
+        "cascade": cascade_model.stats() if cascade_model is not None else None,
+        "microbatch": batcher.stats(),
+        "preprocess_pool": {"processes": PREPROCESS_PROCESSES, "chunk_size": PREPROCESS_CHUNK_SIZE},
+        "db_pool": db_pool.stats()
+    }
+
+
+COMMENT_COLUMNS = "comment_id, comment_text, comment_ton, probability, model_version, classified_at"
+
+
+def build_comments_query(after_id, status, min_probability, max_probability):
+    """SELECT по комментариям с фильтрами в порядке comment_id (keyset-пагинация)"""
+    conditions = ["comment_id > %s"]
+    params = [after_id]
+
+    if status == 'pending':
+        conditions.append("comment_ton IS NULL")
+    elif status == 'toxic':
+        conditions.append("comment_ton = 1")
+    elif status == 'non_toxic':
+        conditions.append("comment_ton = 0")
+
+    if min_probability is not None:
+        conditions.append("probability >= %s")
+        params.append(min_probability)
+    if max_probability is not None:
+        conditions.append("probability <= %s")
+        params.append(max_probability)
+
+    query = f"SELECT {COMMENT_COLUMNS} FROM comments WHERE {' AND '.join(conditions)} ORDER BY comment_id"
+    return query, params
+
+
+def json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+async def stream_comments(query, params):
+    """Отдаёт строки в NDJSON по мере чтения из небуферизованного курсора"""
+    async with get_db_connection() as conn:
+        async with conn.cursor(aiomysql.SSDictCursor) as cursor:
+            await cursor.execute(query, params)
+            while True:
+                rows = await cursor.fetchmany(COMMENTS_MAX_PAGE_SIZE)
+                if not rows:
+                    break
+                yield ''.join(json.dumps(row, ensure_ascii=False, default=json_default) + '\n' for row in rows)
+
+
 @app.get("/comments", response_model=List[Comment])
-def get_comments():
-    """Получить все комментарии"""
+async def get_comments(
+        response: Response,
+        after_id: int = 0,
+        limit: int = Query(COMMENTS_PAGE_SIZE, ge=1, le=COMMENTS_MAX_PAGE_SIZE),
+        status: Optional[Literal['pending', 'toxic', 'non_toxic']] = None,
+        min_probability: Optional[float] = Query(None, ge=0, le=1),
+        max_probability: Optional[float] = Query(None, ge=0, le=1),
+        format: Literal['json', 'ndjson'] = 'json'
+):
+    """Получить комментарии постранично
+
+    Страница — до limit комментариев с comment_id больше after_id; следующая
+    страница запрашивается с after_id из заголовка X-Next-After-Id. Фильтры:
+    status (pending — без тональности, toxic, non_toxic) и диапазон вероятности.
+    format=ndjson выгружает все подходящие строки потоком, без ограничения limit.
+    """
+    query, params = build_comments_query(after_id, status, min_probability, max_probability)
+
+    if format == 'ndjson':
+        return StreamingResponse(stream_comments(query, params), media_type="application/x-ndjson")
+
     try:
-        with get_db_connection() as conn:
-            with conn.cursor() as cursor:
-                cursor.execute(f"SELECT comment_id, comment_text, comment_ton FROM comments")
-                comments = cursor.fetchall()
-        return comments
+        async with get_db_connection() as conn:
+            async with conn.cursor() as cursor:
+                with stage('db'):
+                    await cursor.execute(query + " LIMIT %s", params + [limit])
+                    comments = await cursor.fetchall()
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Ошибка базы данных: {str(e)}")
 
+    if len(comments) == limit:
+        response.headers["X-Next-After-Id"] = str(comments[-1]['comment_id'])
+    return comments
 
-@app.post("/comments/{comment_id}/predict", response_model=SentimentResponse)
-def predict_comment(comment_id: int):
-    """Предсказать тональность комментария по ID"""
-    if model is None:
-        raise HTTPException(status_code=503, detail="Модель не загружена")
 
-    if tfidf is None:
-        raise HTTPException(status_code=503, detail="Векторизатор не загружен")
+comments_summary = None
+comments_summary_expires = 0.0
+comments_summary_lock = asyncio.Lock()
+
+
+@app.get("/comments/summary")
+async def get_comments_summary():
+    """Количество комментариев: всего, без тональности, токсичных и нетоксичных
+
+    Подсчёт просматривает всю таблицу, поэтому результат кэшируется на
+    COMMENTS_SUMMARY_TTL секунд и пересчитывается одним запросом за раз.
+    """
+    if time.monotonic() < comments_summary_expires:
+        return comments_summary
+    async with comments_summary_lock:
+        if time.monotonic() < comments_summary_expires:
+            return comments_summary
+        return await refresh_comments_summary()
+
 
+async def refresh_comments_summary():
+    global comments_summary, comments_summary_expires
     try:
-        with get_db_connection() as conn:
-            with conn.cursor() as cursor:
-                cursor.execute(
-                    "SELECT comment_id, comment_text, comment_ton FROM comments WHERE comment_id = %s",
-                    (comment_id,)
-                )
-                comment = cursor.fetchone()
+        async with get_db_connection() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute("SELECT comment_ton, COUNT(*) AS n FROM comments GROUP BY comment_ton")
+                counts = {row['comment_ton']: row['n'] for row in await cursor.fetchall()}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Ошибка базы данных: {str(e)}")
 
-        if not comment:
-            raise HTTPException(status_code=404, detail="Комментарий не найден")
+    comments_summary = {
+        "total": sum(counts.values()),
+        "pending": counts.get(None, 0),
+        "toxic": counts.get(1, 0),
+        "non_toxic": counts.get(0, 0)
+    }
+    comments_summary_expires = time.monotonic() + COMMENTS_SUMMARY_TTL
+    return comments_summary
+
+
+async def iter_body_lines(request):
+    """Строки тела запроса по мере получения, без чтения всего тела в память"""
+    buffer = b''
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b'\n')
+        for line in lines:
+            yield line.decode('utf-8').rstrip('\r')
+    if buffer:
+        yield buffer.decode('utf-8').rstrip('\r')
+
+
+async def iter_csv_records(lines):
+    """Записи CSV; поле в кавычках может занимать несколько строк"""
+    pending = []
+    quotes = 0
+    async for line in lines:
+        pending.append(line)
+        quotes += line.count('"')
+        if quotes % 2 == 0:
+            yield next(csv.reader(['\n'.join(pending)]), [])
+            pending = []
+            quotes = 0
+    if pending:
+        yield next(csv.reader(['\n'.join(pending)]), [])
+
+
+def parse_bulk_comment(raw):
+    """Проверяет запись загрузки; возвращает (comment_id или None, comment_text)"""
+    text = raw.get('comment_text')
+    if not isinstance(text, str) or not text.strip():
+        raise ValueError("нет comment_text")
+    comment_id = raw.get('comment_id')
+    if comment_id in (None, ''):
+        return None, text
+    if isinstance(comment_id, str) and comment_id.strip().isascii() and comment_id.strip().isdigit():
+        comment_id = int(comment_id)
+    elif not isinstance(comment_id, int) or isinstance(comment_id, bool):
+        # true, 2.7 и "1e3" не должны молча превращаться в другой comment_id
+        raise ValueError("comment_id должен быть целым числом")
+    if comment_id < 1:
+        raise ValueError("comment_id должен быть положительным")
+    return comment_id, text
+
+
+async def iter_bulk_comments(request, content_type):
+    """Пары (номер записи, словарь полей) из NDJSON или CSV с заголовком"""
+    lines = iter_body_lines(request)
+    if 'csv' in content_type:
+        header = None
+        number = 0
+        async for record in iter_csv_records(lines):
+            if not any(record):
+                continue
+            if header is None:
+                header = [column.strip() for column in record]
+                continue
+            number += 1
+            yield number, dict(zip(header, record))
+    else:
+        number = 0
+        async for line in lines:
+            if not line.strip():
+                continue
+            number += 1
+            try:
+                raw = json.loads(line)
+            except ValueError as e:
+                raw = e
+            yield number, raw
+
+
+async def insert_comment_batch(conn, batch, classify):
+    """Вставляет порцию одним многострочным INSERT; возвращает (вставлено, дубликатов)"""
+    if classify:
+        rows = [{'comment_id': comment_id, 'comment_text': text} for comment_id, text in batch]
+        if preprocess_pool is not None:
+            processed_texts = await preprocess_texts_parallel_async(
+                preprocess_pool, [text for _, text in batch], PREPROCESS_PROCESSES)
+            results = await run_cpu_bound(classify_processed_rows, rows, processed_texts)
+        else:
+            results = await run_cpu_bound(classify_rows, rows)
+        values = ', '.join(['(%s, %s, %s, %s, %s, NOW())'] * len(batch))
+        params = [value for (comment_id, text), (_, comment_ton, probability) in zip(batch, results)
+                  for value in (comment_id, text, comment_ton, probability, MODEL_VERSION)]
+        columns = "comment_id, comment_text, comment_ton, probability, model_version, classified_at"
+    else:
+        values = ', '.join(['(%s, %s)'] * len(batch))
+        params = [value for row in batch for value in row]
+        columns = "comment_id, comment_text"
+
+    async with conn.cursor() as cursor:
+        # Строка с существующим comment_id не меняется и не учитывается в rowcount
+        await cursor.execute(
+            f"INSERT INTO comments ({columns}) VALUES {values} "
+            f"ON DUPLICATE KEY UPDATE comment_id = comment_id",
+            params
+        )
+        inserted = cursor.rowcount
+    await conn.commit()
+    return inserted, len(batch) - inserted
+
+
+@app.post("/comments/bulk")
+async def bulk_insert_comments(request: Request, classify: bool = False,
+                               batch_size: int = Query(BULK_INSERT_BATCH_SIZE, ge=1,
+                                                       le=BULK_INSERT_MAX_BATCH_SIZE)):
+    """Загрузить комментарии из NDJSON или CSV (колонки comment_text и необязательная comment_id)
+
+    Тело разбирается потоком и вставляется порциями по batch_size строк одним
+    INSERT на порцию. С classify=true тональность вычисляется до вставки и
+    записывается тем же INSERT. Строки с уже существующим comment_id считаются
+    дубликатами, некорректные записи — ошибками (первые из них перечисляются в ответе).
+    """
+    if classify and model is None:
+        raise HTTPException(status_code=503, detail="Модель не загружена")
 
-        processed_text = preprocess_text(comment['comment_text'])
+    content_type = request.headers.get('content-type', '')
+    inserted = 0
+    duplicates = 0
+    errors = 0
+    error_details = []
 
-        if not processed_text:
-            processed_text = "пустой комментарий"
+    def add_error(number, message):
+        nonlocal errors
+        errors += 1
+        if len(error_details) < BULK_MAX_REPORTED_ERRORS:
+            error_details.append({"record": number, "error": message})
 
-        text_vectorized = tfidf.transform([processed_text]).toarray().astype(np.float32)
+    async def flush(conn, batch, first_number):
+        nonlocal inserted, duplicates
+        try:
+            batch_inserted, batch_duplicates = await insert_comment_batch(conn, batch, classify)
+            inserted += batch_inserted
+            duplicates += batch_duplicates
+        except Exception as e:
+            await conn.rollback()
+            for number in range(first_number, first_number + len(batch)):
+                add_error(number, f"Ошибка базы данных: {str(e)}")
+
+    try:
+        async with get_db_connection() as conn:
+            batch = []
+            first_number = 1
+            async for number, raw in iter_bulk_comments(request, content_type):
+                try:
+                    if isinstance(raw, Exception):
+                        raise raw
+                    if not isinstance(raw, dict):
+                        raise ValueError("ожидается объект с comment_text")
+                    row = parse_bulk_comment(raw)
+                except (ValueError, TypeError) as e:
+                    add_error(number, str(e))
+                    continue
+
+                if not batch:
+                    first_number = number
+                batch.append(row)
+                if len(batch) >= batch_size:
+                    await flush(conn, batch, first_number)
+                    batch = []
+            if batch:
+                await flush(conn, batch, first_number)
+    except UnicodeDecodeError as e:
+        raise HTTPException(status_code=422, detail=f"Некорректная кодировка, ожидается UTF-8: {str(e)}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Ошибка при загрузке: {str(e)}")
 
-        probability = float(model.predict(text_vectorized, verbose=0)[0][0])
-        comment_ton = 1 if probability > 0.5 else 0
+    return {
+        "inserted": inserted,
+        "duplicates": duplicates,
+        "errors": errors,
+        "classified": classify,
+        "error_details": error_details
+    }
 
-        with get_db_connection() as conn:
-            with conn.cursor() as cursor:
-                cursor.execute(
-                    "UPDATE comments SET comment_ton = %s WHERE comment_id = %s",
-                    (comment_ton, comment_id)
-                )
-                conn.commit()
+
+@app.post("/comments/{comment_id}/predict", response_model=SentimentResponse)
+async def predict_comment(comment_id: int):
+    """Предсказать тональность комментария по ID"""
+    if model is None:
+        raise HTTPException(status_code=503, detail="Модель не загружена")
+
+    if tfidf is None:
+        raise HTTPException(status_code=503, detail="Векторизатор не загружен")
+
+    try:
+        async with get_db_connection() as conn:
+            async with conn.cursor() as cursor:
+                with stage('db'):
+                    await cursor.execute(
+                        "SELECT comment_id, comment_text, comment_ton FROM comments WHERE comment_id = %s",
+                        (comment_id,)
+                    )
+                    comment = await cursor.fetchone()
+
+                if not comment:
+                    raise HTTPException(status_code=404, detail="Комментарий не найден")
+
+                processed_text = await run_cpu_bound(timed_preprocess_text, comment['comment_text'])
+
+                if not processed_text:
+                    processed_text = "пустой комментарий"
+
+                probability = await predict_single(processed_text)
+                comment_ton = 1 if probability > 0.5 else 0
+
+                with stage('db'):
+                    await cursor.execute(
+                        "UPDATE comments SET comment_ton = %s, probability = %s, model_version = %s, "
+                        "classified_at = NOW() WHERE comment_id = %s",
+                        (comment_ton, probability, MODEL_VERSION, comment_id)
+                    )
+            with stage('db'):
+                await conn.commit()
 
         return {
             "comment_id": comment_id,
@@ -199,67 +596,204 @@ def predict_comment(comment_id: int):
             "comment_ton": comment_ton,
             "probability": probability
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Ошибка при анализе: {str(e)}")
 
 
-@app.post("/predict/all")
-def predict_all_comments():
-    """Предсказать тональность для всех комментариев без тональности"""
-    if model is None:
-        raise HTTPException(status_code=503, detail="Модель не загружена")
+def load_high_water_mark():
+    """Последний comment_id, сохранённый прерванным массовым анализом"""
+    try:
+        with open(PREDICT_ALL_STATE_PATH, 'r', encoding='utf-8') as f:
+            return int(json.load(f)['last_id'])
+    except (OSError, ValueError, KeyError):
+        return 0
+
+
+def save_high_water_mark(last_id):
+    with open(PREDICT_ALL_STATE_PATH, 'w', encoding='utf-8') as f:
+        json.dump({"last_id": last_id}, f)
+
+
+def timed_preprocess_texts(texts):
+    with stage('preprocess'):
+        return preprocess_texts(texts)
+
+
+async def preprocess_rows(rows):
+    """Предобработка текстов порции: в пуле процессов, если он запущен, иначе в потоках инференса"""
+    texts = [row['comment_text'] for row in rows]
+    if preprocess_pool is not None:
+        return await preprocess_texts_parallel_async(preprocess_pool, texts, PREPROCESS_PROCESSES)
+    return await run_cpu_bound(timed_preprocess_texts, texts)
+
+
+async def run_bulk_classification(job_id, chunk_size, resume):
+    """Массовый анализ комментариев без тональности или классифицированных другой версией модели
+
+    Строки читаются потоково (небуферизованный курсор) в порядке comment_id,
+    каждая порция классифицируется пакетом и фиксируется отдельной транзакцией.
+    После каждой порции сохраняется отметка последнего comment_id, поэтому
+    прерванный запуск с resume=true продолжает работу с того же места.
+    Возвращает итоговый статус задачи: done или cancelled.
+    """
+    start_id = load_high_water_mark() if resume else 0
+    last_id = start_id
+    processed = 0
+    errors = 0
+    started = time.perf_counter()
+
+    async with get_db_connection() as read_conn, get_db_connection() as write_conn:
+        async with read_conn.cursor() as count_cursor:
+            await count_cursor.execute(
+                f"SELECT COUNT(*) AS n FROM comments WHERE comment_id > %s AND {PENDING_CONDITION}",
+                (start_id, MODEL_VERSION)
+            )
+            total = (await count_cursor.fetchone())['n']
+        await read_conn.commit()
+
+        async with read_conn.cursor(aiomysql.SSDictCursor) as read_cursor:
+            await read_cursor.execute(
+                f"SELECT comment_id, comment_text FROM comments "
+                f"WHERE comment_id > %s AND {PENDING_CONDITION} ORDER BY comment_id",
+                (start_id, MODEL_VERSION)
+            )
+
+            # Предобработка следующей порции идёт, пока текущая классифицируется и записывается
+            rows = await read_cursor.fetchmany(chunk_size)
+            pending = asyncio.ensure_future(preprocess_rows(rows)) if rows else None
+            try:
+                while rows:
+                    next_rows = await read_cursor.fetchmany(chunk_size)
+                    next_pending = asyncio.ensure_future(preprocess_rows(next_rows)) if next_rows else None
+                    processed += len(rows)
 
-    if tfidf is None:
-        raise HTTPException(status_code=503, detail="Векторизатор не загружен")
+                    try:
+                        processed_texts = await pending
+                        results = await run_cpu_bound(classify_processed_rows, rows, processed_texts)
+                        query, params = build_tons_update(results)
+                        async with write_conn.cursor() as write_cursor:
+                            await write_cursor.execute(query, params)
+                        await write_conn.commit()
+                    except Exception as e:
+                        await write_conn.rollback()
+                        print(f"Ошибка при обработке ID {rows[0]['comment_id']}-{rows[-1]['comment_id']}: {str(e)}")
+                        errors += len(rows)
+
+                    last_id = rows[-1]['comment_id']
+                    rows, pending = next_rows, next_pending
+                    rate = processed / (time.perf_counter() - started)
+                    print(f"Массовый анализ: {processed}/{total} строк, {rate:.1f} строк/с, последний ID {last_id}")
+
+                    # Отметка сохраняется только пока задача принадлежит этому обработчику
+                    cancel_requested = await asyncio.to_thread(
+                        job_store.update_progress, job_id, WORKER_ID, total, processed, errors, round(rate, 1),
+                        last_id)
+                    save_high_water_mark(last_id)
+                    if cancel_requested:
+                        return 'cancelled'
+            finally:
+                # Прерванный проход не оставляет незавершённую предобработку следующей порции
+                if pending is not None and not pending.done():
+                    pending.cancel()
+
+    await asyncio.to_thread(job_store.update_progress, job_id, WORKER_ID, total, processed, errors,
+                            round(processed / (time.perf_counter() - started), 1), last_id)
+    # Проход завершён полностью — следующий запуск снова просматривает всю таблицу
+    save_high_water_mark(0)
+    return 'done'
+
+
+async def job_worker():
+    """Фоновый обработчик очереди: выполняет задачи массового анализа по одной"""
+    while True:
+        job_wakeup.clear()
+        job = await asyncio.to_thread(job_store.claim_next, WORKER_ID)
+        if job is None:
+            try:
+                await asyncio.wait_for(job_wakeup.wait(), JOB_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            continue
 
-    try:
-        with get_db_connection() as conn:
-            with conn.cursor() as cursor:
-                cursor.execute("SELECT comment_id, comment_text FROM comments WHERE comment_ton IS NULL")
-                comments = cursor.fetchall()
+        try:
+            with JobHeartbeat(job_store, job['job_id'], WORKER_ID):
+                status = await run_bulk_classification(job['job_id'], **job['params'])
+            await asyncio.to_thread(job_store.finish, job['job_id'], WORKER_ID, status)
+        except asyncio.CancelledError:
+            # Сервис останавливается — задача продолжится после перезапуска
+            await asyncio.to_thread(job_store.requeue, job['job_id'], WORKER_ID)
+            raise
+        except JobLost:
+            # Задачу признали брошенной, и очередь уже могла перейти к следующей — эта останавливается
+            print(f"Задача массового анализа {job['job_id']} передана другому обработчику, остановка")
+        except Exception as e:
+            print(f"Ошибка задачи массового анализа {job['job_id']}: {str(e)}")
+            await asyncio.to_thread(job_store.finish, job['job_id'], WORKER_ID, 'failed', str(e))
+
+
+@app.on_event("startup")
+async def start_job_worker():
+    global job_worker_task
+    job_worker_task = asyncio.create_task(job_worker())
+
+
+@app.on_event("shutdown")
+async def stop_job_worker():
+    if job_worker_task is not None:
+        job_worker_task.cancel()
+        try:
+            await job_worker_task
+        except asyncio.CancelledError:
+            pass
 
-                if not comments:
-                    return {"message": "Нет комментариев для обработки"}
 
-                updated = 0
-                errors = 0
+@app.post("/predict/all", status_code=202)
+async def predict_all_comments(chunk_size: int = PREDICT_ALL_CHUNK_SIZE, resume: bool = True):
+    """Поставить в очередь массовый анализ всех комментариев без тональности
 
-                for comment in comments:
-                    try:
-                        processed_text = preprocess_text(comment['comment_text'])
+    Возвращает job_id сразу; ход выполнения — GET /jobs/{job_id}, отмена — DELETE /jobs/{job_id}.
+    Задачи выполняются по одной, поэтому пересекающиеся запуски не обрабатывают одни и те же строки.
+    """
+    if model is None:
+        raise HTTPException(status_code=503, detail="Модель не загружена")
 
-                        if not processed_text:
-                            processed_text = "пустой комментарий"
+    if tfidf is None:
+        raise HTTPException(status_code=503, detail="Векторизатор не загружен")
 
-                        text_vectorized = tfidf.transform([processed_text]).toarray().astype(np.float32)
+    if chunk_size < 1:
+        raise HTTPException(status_code=422, detail="chunk_size должен быть положительным")
 
-                        probability = float(model.predict(text_vectorized, verbose=0)[0][0])
-                        comment_ton = 1 if probability > 0.5 else 0
+    job = await asyncio.to_thread(job_store.create, {"chunk_size": chunk_size, "resume": resume})
+    job_wakeup.set()
+    return {
+        "message": "Массовый анализ поставлен в очередь",
+        "job_id": job['job_id'],
+        "status": job['status']
+    }
 
-                        cursor.execute(
-                            "UPDATE comments SET comment_ton = %s WHERE comment_id = %s",
-                            (comment_ton, comment['comment_id'])
-                        )
-                        updated += 1
 
-                    except Exception as e:
-                        print(f"Ошибка при обработке ID {comment['comment_id']}: {str(e)}")
-                        errors += 1
-                        continue
+@app.get("/jobs/{job_id}", response_model=JobResponse)
+async def get_job(job_id: str):
+    """Состояние задачи массового анализа"""
+    job = await asyncio.to_thread(job_store.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Задача не найдена")
+    return job
 
-                conn.commit()
 
-        return {
-            "message": f"Обработано комментариев: {updated}",
-            "errors": errors,
-            "total": len(comments)
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Ошибка при массовом анализе: {str(e)}")
+@app.delete("/jobs/{job_id}", response_model=JobResponse)
+async def cancel_job(job_id: str):
+    """Отменить задачу: из очереди — сразу, выполняющуюся — после текущей порции"""
+    job = await asyncio.to_thread(job_store.cancel, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Задача не найдена")
+    return job
 
 
 @app.post("/predict/text", response_model=TextPredictionResponse)
-def predict_text(text: str):
+async def predict_text(text: str):
     """Предсказать тональность для произвольного текста"""
     if model is None:
         raise HTTPException(status_code=503, detail="Модель не загружена")
@@ -268,14 +802,12 @@ def predict_text(text: str):
         raise HTTPException(status_code=503, detail="Векторизатор не загружен")
 
     try:
-        processed_text = preprocess_text(text)
+        processed_text = await run_cpu_bound(timed_preprocess_text, text)
 
         if not processed_text:
             processed_text = "пустой комментарий"
 
-        text_vectorized = tfidf.transform([processed_text]).toarray().astype(np.float32)
-
-        probability = float(model.predict(text_vectorized, verbose=0)[0][0])
+        probability = await predict_single(processed_text)
         sentiment = "токсичный" if probability > 0.5 else "нетоксичный"
         confidence = probability if probability > 0.5 else 1 - probability
 
@@ -287,4 +819,68 @@ def predict_text(text: str):
             "confidence": confidence
         }
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Ошибка при анализе текста: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Ошибка при анализе текста: {str(e)}")
+
+
+def parse_text_items(body, content_type):
+    """Разбирает тело запроса: JSON-массив или NDJSON (по одному объекту в строке)"""
+    if 'ndjson' in content_type or 'jsonlines' in content_type:
+        raw_items = [json.loads(line) for line in body.decode('utf-8').splitlines() if line.strip()]
+    else:
+        raw_items = json.loads(body)
+        if not isinstance(raw_items, list):
+            raise ValueError("ожидается массив объектов {id, text}")
+    return [TextItem(**item) for item in raw_items]
+
+
+def predict_text_items(items, chunk_size):
+    """Пакетный анализ: одна предобработка, одна векторизация и проход модели по частям"""
+    with stage('preprocess'):
+        processed_texts = preprocess_texts([item.text for item in items])
+    processed_texts = [text or "пустой комментарий" for text in processed_texts]
+    probabilities = predict_probabilities(processed_texts, chunk_size)
+
+    results = []
+    for item, processed_text, probability in zip(items, processed_texts, probabilities):
+        probability = float(probability)
+        results.append({
+            "id": item.id,
+            "original_text": item.text,
+            "processed_text": processed_text,
+            "sentiment": "токсичный" if probability > 0.5 else "нетоксичный",
+            "probability": probability,
+            "confidence": probability if probability > 0.5 else 1 - probability
+        })
+    return results
+
+
+@app.post("/predict/texts", response_model=List[BatchTextPredictionResponse])
+async def predict_texts(request: Request, chunk_size: int = PREDICT_CHUNK_SIZE):
+    """Предсказать тональность для пакета текстов (JSON-массив или NDJSON)"""
+    if model is None:
+        raise HTTPException(status_code=503, detail="Модель не загружена")
+
+    if tfidf is None:
+        raise HTTPException(status_code=503, detail="Векторизатор не загружен")
+
+    if chunk_size < 1:
+        raise HTTPException(status_code=422, detail="chunk_size должен быть положительным")
+
+    try:
+        items = parse_text_items(await request.body(), request.headers.get('content-type', ''))
+    except Exception as e:
+        raise HTTPException(status_code=422, detail=f"Некорректный формат запроса: {str(e)}")
+
+    if not items:
+        return []
+
+    try:
+        return await run_cpu_bound(predict_text_items, items, chunk_size)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Ошибка при пакетном анализе: {str(e)}")
+
+
+@app.on_event("startup")
+async def record_startup_time():
+    # Регистрируется последним, поэтому выполняется после остальных обработчиков startup
+    startup_seconds.set(value=time.perf_counter() - INIT_STARTED)
@@ -0,0 +1,240 @@
+"""Метрики в текстовом формате Prometheus для GET /metrics
+
+Модуль общий для обоих сервисов: CommentTon импортирует его как metrics,
+сервис цен на жильё (../house_main.py) — как CommentTon_Kildibaeva.metrics.
+"""
+import bisect
+import threading
+import time
+
+# Границы корзин (с) для длительности запросов и этапов обработки
+LATENCY_BUCKETS = [0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+
+
+class Histogram:
+    """Гистограмма с фиксированными границами корзин"""
+
+    def __init__(self, buckets):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def snapshot(self):
+        """Накопительные счётчики по верхним границам корзин (последняя — +Inf)"""
+        with self._lock:
+            counts = list(self.counts)
+            total_sum = self.sum
+            total_count = self.count
+
+        cumulative = {}
+        running = 0
+        for bound, value in zip(self.buckets + ('+Inf',), counts):
+            running += value
+            cumulative[str(bound)] = running
+        return {
+            "buckets": cumulative,
+            "count": total_count,
+            "sum": total_sum,
+            "mean": total_sum / total_count if total_count else 0.0
+        }
+
+
+class Counter:
+    """Монотонный счётчик с метками"""
+
+    type = 'counter'
+
+    def __init__(self, labelnames=()):
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return list(self._values.items())
+
+
+class Gauge(Counter):
+    """Текущее значение с метками (может уменьшаться)"""
+
+    type = 'gauge'
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, *labels, value):
+        with self._lock:
+            self._values[labels] = value
+
+
+class HistogramVec:
+    """Набор гистограмм с общими корзинами, по одной на сочетание меток"""
+
+    type = 'histogram'
+
+    def __init__(self, buckets, labelnames=()):
+        self.buckets = buckets
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *labels):
+        child = self._children.get(labels)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(labels, Histogram(self.buckets))
+        return child
+
+    def samples(self):
+        with self._lock:
+            return list(self._children.items())
+
+
+class StageTimer:
+    """Контекстный менеджер: время блока в секундах записывается в гистограмму"""
+
+    __slots__ = ('histogram', 'started')
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started)
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{escape_label(value)}"' for name, value in pairs) + '}'
+
+
+class Registry:
+    """Метрики сервиса в текстовом формате Prometheus (GET /metrics)"""
+
+    def __init__(self):
+        self._metrics = []
+        self._callbacks = []
+
+    def register(self, name, help_text, metric):
+        self._metrics.append((name, help_text, metric))
+        return metric
+
+    def counter(self, name, help_text, labelnames=()):
+        return self.register(name, help_text, Counter(labelnames))
+
+    def gauge(self, name, help_text, labelnames=()):
+        return self.register(name, help_text, Gauge(labelnames))
+
+    def histogram(self, name, help_text, buckets, labelnames=()):
+        return self.register(name, help_text, HistogramVec(buckets, labelnames))
+
+    def gauge_callback(self, name, help_text, func):
+        """Показатель, значение которого вычисляется func() при каждом запросе /metrics"""
+        self._callbacks.append((name, help_text, 'gauge', func))
+
+    def counter_callback(self, name, help_text, func):
+        """Счётчик, который ведёт сам объект (например, попадания в кэш): func() читается при каждом запросе /metrics"""
+        self._callbacks.append((name, help_text, 'counter', func))
+
+    def render(self):
+        lines = []
+        for name, help_text, metric in self._metrics:
+            lines.append(f"# HELP {name} {help_text}")
+            if isinstance(metric, Histogram):
+                lines.append(f"# TYPE {name} histogram")
+                lines.extend(self._render_histogram(name, (), (), metric))
+                continue
+            lines.append(f"# TYPE {name} {metric.type}")
+            for labels, value in metric.samples():
+                if metric.type == 'histogram':
+                    lines.extend(self._render_histogram(name, metric.labelnames, labels, value))
+                else:
+                    lines.append(f"{name}{format_labels(metric.labelnames, labels)} {value}")
+        for name, help_text, metric_type, func in self._callbacks:
+            try:
+                value = func()
+            except Exception:
+                continue
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            lines.append(f"{name} {value}")
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def _render_histogram(name, labelnames, labels, histogram):
+        snapshot = histogram.snapshot()
+        lines = [
+            f"{name}_bucket{format_labels(labelnames, labels, [('le', bound)])} {count}"
+            for bound, count in snapshot['buckets'].items()
+        ]
+        lines.append(f"{name}_sum{format_labels(labelnames, labels)} {snapshot['sum']}")
+        lines.append(f"{name}_count{format_labels(labelnames, labels)} {snapshot['count']}")
+        return lines
+
+
+# Общий реестр метрик процесса
+registry = Registry()
+
+
+class PrometheusMiddleware:
+    """ASGI-middleware: число запросов, ошибок, запросы в обработке и длительность по маршрутам"""
+
+    def __init__(self, app, registry, prefix):
+        self.app = app
+        self.requests = registry.counter(f"{prefix}_http_requests_total", "Число HTTP-запросов",
+                                         ('method', 'route', 'status'))
+        self.errors = registry.counter(f"{prefix}_http_errors_total", "Число ответов с кодом 5xx",
+                                       ('method', 'route'))
+        self.in_flight = registry.gauge(f"{prefix}_http_requests_in_flight", "Запросы в обработке")
+        self.duration = registry.histogram(f"{prefix}_http_request_duration_seconds",
+                                           "Длительность обработки HTTP-запроса", LATENCY_BUCKETS,
+                                           ('method', 'route'))
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        started = time.perf_counter()
+        self.in_flight.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            self.in_flight.dec()
+            route = scope.get('route')
+            path = route.path if route is not None else 'unmatched'
+            method = scope['method']
+            self.duration.labels(method, path).observe(time.perf_counter() - started)
+            self.requests.inc(method, path, str(status))
+            if status >= 500:
+                self.errors.inc(method, path)
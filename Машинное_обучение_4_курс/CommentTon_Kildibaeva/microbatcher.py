@@ -0,0 +1,110 @@
+import asyncio
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from metrics import Histogram
+
+# Микробатчинг одиночных запросов: пакет отправляется в модель при достижении
+# размера MICROBATCH_MAX_SIZE или через MICROBATCH_MAX_WAIT_MS после первого запроса
+MICROBATCH_MAX_SIZE = 64
+MICROBATCH_MAX_WAIT_MS = 5
+
+
+class MicroBatcher:
+    """Объединяет одиночные запросы к модели в пакеты
+
+    Вызывающие потоки кладут текст в очередь и ждут результат; фоновый поток
+    забирает накопившиеся запросы и выполняет один проход модели на весь пакет.
+    """
+
+    def __init__(self, predict_fn, max_batch_size=MICROBATCH_MAX_SIZE, max_wait_ms=MICROBATCH_MAX_WAIT_MS):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.batch_sizes = Histogram([1, 2, 4, 8, 16, 32, 64, 128, 256])
+        self.queue_wait_ms = Histogram([0.5, 1, 2, 5, 10, 25, 50, 100, 250, 1000])
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, processed_text):
+        """Ставит текст в очередь; Future получит вероятность после прохода модели"""
+        self._ensure_started()
+        future = Future()
+        self._queue.put((processed_text, time.perf_counter(), future))
+        return future
+
+    def predict(self, processed_text):
+        """Вероятность токсичности для одного предобработанного текста"""
+        return self.submit(processed_text).result()
+
+    async def predict_async(self, processed_text):
+        """То же, что predict, но без блокировки цикла событий"""
+        return await asyncio.wrap_future(self.submit(processed_text))
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="microbatcher", daemon=True)
+                self._thread.start()
+
+    def _collect(self):
+        """Ждёт первый запрос и добирает пакет до лимита размера или времени ожидания"""
+        first = self._queue.get()
+        batch = [first]
+        deadline = first[1] + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            try:
+                if timeout > 0:
+                    batch.append(self._queue.get(timeout=timeout))
+                else:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            try:
+                self._process(self._collect())
+            except Exception as e:
+                # Поток обслуживает все одиночные запросы, поэтому ошибка одного пакета его не останавливает
+                print(f"Ошибка микробатчинга: {str(e)}")
+
+    def _process(self, batch):
+        # Запросы, отменённые вызывающей стороной (например, при обрыве соединения), в модель не идут;
+        # после set_running_or_notify_cancel остальные Future уже нельзя отменить
+        batch = [item for item in batch if item[2].set_running_or_notify_cancel()]
+        if not batch:
+            return
+        started = time.perf_counter()
+        for _, enqueued, _ in batch:
+            self.queue_wait_ms.observe((started - enqueued) * 1000)
+        self.batch_sizes.observe(len(batch))
+
+        try:
+            probabilities = self.predict_fn([text for text, _, _ in batch])
+        except Exception as e:
+            for _, _, future in batch:
+                future.set_exception(e)
+            return
+
+        for (_, _, future), probability in zip(batch, probabilities):
+            try:
+                future.set_result(float(probability))
+            except Exception as e:
+                future.set_exception(e)
+
+    def stats(self):
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "queue_size": self._queue.qsize(),
+            "batch_size": self.batch_sizes.snapshot(),
+            "queue_wait_ms": self.queue_wait_ms.snapshot()
+        }
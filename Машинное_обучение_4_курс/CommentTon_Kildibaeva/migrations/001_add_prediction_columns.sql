@@ -0,0 +1,8 @@
+-- Результат классификации хранится рядом с comment_ton,
+-- чтобы чтение комментариев не требовало повторного инференса
+USE db_comment;
+
+ALTER TABLE comments
+    ADD COLUMN probability FLOAT NULL,
+    ADD COLUMN model_version VARCHAR(32) NULL,
+    ADD COLUMN classified_at DATETIME NULL;
@@ -0,0 +1,7 @@
+-- Индексы под фильтры GET /comments и выборку /predict/all:
+-- по тональности с keyset-пагинацией по comment_id и по диапазону вероятности
+USE db_comment;
+
+CREATE INDEX idx_comments_ton_id ON comments (comment_ton, comment_id);
+CREATE INDEX idx_comments_ton_probability ON comments (comment_ton, probability);
+CREATE INDEX idx_comments_model_version ON comments (model_version);
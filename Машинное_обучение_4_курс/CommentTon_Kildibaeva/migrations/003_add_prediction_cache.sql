@@ -0,0 +1,10 @@
+-- Постоянный уровень кэша предсказаний: вероятность по хэшу предобработанного текста
+-- для каждой версии модели (включается COMMENTTON_PREDICTION_CACHE_TABLE=1)
+USE db_comment;
+
+CREATE TABLE IF NOT EXISTS prediction_cache (
+    text_hash BINARY(16) NOT NULL,
+    model_version VARCHAR(32) NOT NULL,
+    probability FLOAT NOT NULL,
+    PRIMARY KEY (text_hash, model_version)
+);
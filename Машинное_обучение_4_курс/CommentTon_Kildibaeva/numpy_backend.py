@@ -0,0 +1,82 @@
+import numpy as np
+
+
+def relu(x):
+    return np.maximum(x, 0, out=x)
+
+
+def sigmoid(x):
+    return 1 / (1 + np.exp(-x))
+
+
+def linear(x):
+    return x
+
+
+ACTIVATIONS = {
+    'relu': relu,
+    'sigmoid': sigmoid,
+    'tanh': np.tanh,
+    'linear': linear
+}
+
+
+class NumpyModel:
+    """Инференс полносвязной сети без TensorFlow
+
+    Первый слой умножается напрямую на разреженную матрицу TF-IDF (CSR),
+    остальные слои считаются плотными операциями NumPy.
+    """
+
+    def __init__(self, kernels, biases, activations, source_digest=None):
+        unknown = [name for name in activations if name not in ACTIVATIONS]
+        if unknown:
+            raise ValueError(f"Неподдерживаемые функции активации: {unknown}")
+        self.kernels = [np.asarray(k, dtype=np.float32) for k in kernels]
+        self.biases = [np.asarray(b, dtype=np.float32) for b in biases]
+        self.activations = [ACTIVATIONS[name] for name in activations]
+        # SHA-256 исходного .keras-файла: версия модели не меняется при смене бэкенда
+        self.source_digest = source_digest
+
+    @classmethod
+    def load(cls, path):
+        """Загружает веса, сохранённые export_weights.py"""
+        with np.load(path) as data:
+            activations = [str(name) for name in data['activations']]
+            kernels = [data[f'kernel_{i}'] for i in range(len(activations))]
+            biases = [data[f'bias_{i}'] for i in range(len(activations))]
+            source_digest = str(data['source_digest']) if 'source_digest' in data.files else None
+        return cls(kernels, biases, activations, source_digest)
+
+    @property
+    def input_dim(self):
+        return self.kernels[0].shape[0]
+
+    def predict_sparse(self, matrix):
+        """Вероятности положительного класса для CSR-матрицы признаков"""
+        hidden = np.asarray(matrix.astype(np.float32) @ self.kernels[0])
+        hidden += self.biases[0]
+        hidden = self.activations[0](hidden)
+        for kernel, bias, activation in zip(self.kernels[1:], self.biases[1:], self.activations[1:]):
+            hidden = hidden @ kernel
+            hidden += bias
+            hidden = activation(hidden)
+        return hidden[:, 0]
+
+
+class LinearModel:
+    """Логистическая регрессия поверх разреженной матрицы TF-IDF"""
+
+    def __init__(self, coef, intercept):
+        self.coef = np.asarray(coef, dtype=np.float32).ravel()
+        self.intercept = np.float32(intercept)
+
+    @property
+    def input_dim(self):
+        return self.coef.shape[0]
+
+    def predict_sparse(self, matrix):
+        """Вероятности положительного класса для CSR-матрицы признаков"""
+        logits = np.asarray(matrix.astype(np.float32) @ self.coef).ravel()
+        logits += self.intercept
+        return sigmoid(logits)
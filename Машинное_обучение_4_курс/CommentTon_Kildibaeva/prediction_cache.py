@@ -0,0 +1,159 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+# Ключей в одном запросе к prediction_cache: длинные IN (...) и VALUES упираются в
+# max_allowed_packet и ограничение числа параметров, поэтому большие порции делятся
+STORE_CHUNK_SIZE = 500
+
+
+def text_key(processed_text):
+    """Ключ кэша — 16-байтовый хэш предобработанного текста"""
+    return hashlib.blake2b(processed_text.encode('utf-8'), digest_size=16).digest()
+
+
+class PredictionCacheStore:
+    """Постоянный уровень кэша — таблица prediction_cache (migrations/003_add_prediction_cache.sql)
+
+    Записи привязаны к версии модели: при смене model_1.keras или tfidf.pkl
+    старые записи не читаются и удаляются методом purge_other_versions.
+    """
+
+    def __init__(self, pool, model_version):
+        self.pool = pool
+        self.model_version = model_version
+
+    def get_many(self, keys):
+        keys = list(keys)
+        found = {}
+        with self.pool.connection() as conn:
+            with conn.cursor() as cursor:
+                for start in range(0, len(keys), STORE_CHUNK_SIZE):
+                    chunk = keys[start:start + STORE_CHUNK_SIZE]
+                    placeholders = ', '.join(['%s'] * len(chunk))
+                    cursor.execute(
+                        f"SELECT text_hash, probability FROM prediction_cache "
+                        f"WHERE model_version = %s AND text_hash IN ({placeholders})",
+                        [self.model_version] + chunk
+                    )
+                    found.update((bytes(row['text_hash']), row['probability']) for row in cursor.fetchall())
+            conn.commit()
+        return found
+
+    def put_many(self, items):
+        items = list(items)
+        with self.pool.connection() as conn:
+            with conn.cursor() as cursor:
+                for start in range(0, len(items), STORE_CHUNK_SIZE):
+                    chunk = items[start:start + STORE_CHUNK_SIZE]
+                    placeholders = ', '.join(['(%s, %s, %s)'] * len(chunk))
+                    params = [value for key, probability in chunk for value in (key, self.model_version, probability)]
+                    cursor.execute(
+                        f"INSERT IGNORE INTO prediction_cache (text_hash, model_version, probability) "
+                        f"VALUES {placeholders}",
+                        params
+                    )
+            conn.commit()
+
+    def purge_other_versions(self):
+        with self.pool.connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("DELETE FROM prediction_cache WHERE model_version <> %s", (self.model_version,))
+                deleted = cursor.rowcount
+            conn.commit()
+        return deleted
+
+
+class PredictionCache:
+    """Кэш вероятностей по хэшу предобработанного текста
+
+    Первый уровень — ограниченный LRU в памяти процесса, второй (необязательный) —
+    PredictionCacheStore. Кэш создаётся под конкретную версию модели, поэтому
+    после замены модели или векторизатора результаты прежней версии не используются.
+    Ошибки постоянного уровня не прерывают анализ: такие ключи считаются промахами.
+    """
+
+    def __init__(self, maxsize, store=None):
+        self.maxsize = maxsize
+        self.store = store
+        self.hits = 0
+        self.misses = 0
+        self.store_hits = 0
+        self.store_errors = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def peek(self, key):
+        """Вероятность из памяти или None; промах не учитывается (его учтёт get_many)"""
+        with self._lock:
+            probability = self._data.get(key)
+            if probability is not None:
+                self._data.move_to_end(key)
+                self.hits += 1
+        return probability
+
+    def get_many(self, keys, use_store=True):
+        """Найденные вероятности {ключ: вероятность} из памяти, затем из таблицы"""
+        found = {}
+        missing = []
+        with self._lock:
+            for key in keys:
+                probability = self._data.get(key)
+                if probability is not None:
+                    self._data.move_to_end(key)
+                    found[key] = probability
+                    self.hits += 1
+                else:
+                    missing.append(key)
+
+        if missing and use_store and self.store is not None:
+            try:
+                stored = self.store.get_many(list(dict.fromkeys(missing)))
+            except Exception as e:
+                print(f"Ошибка чтения кэша предсказаний: {str(e)}")
+                stored = {}
+                self.store_errors += 1
+            if stored:
+                self._remember(stored.items())
+                found.update(stored)
+                remaining = [key for key in missing if key not in stored]
+                with self._lock:
+                    self.store_hits += len(missing) - len(remaining)
+                missing = remaining
+
+        with self._lock:
+            self.misses += len(missing)
+        return found
+
+    def put_many(self, items, use_store=True):
+        items = [(key, float(probability)) for key, probability in items]
+        self._remember(items)
+        if use_store and self.store is not None and items:
+            try:
+                self.store.put_many(items)
+            except Exception as e:
+                print(f"Ошибка записи кэша предсказаний: {str(e)}")
+                self.store_errors += 1
+
+    def _remember(self, items):
+        with self._lock:
+            for key, probability in items:
+                self._data[key] = probability
+                self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            size = len(self._data)
+        lookups = self.hits + self.store_hits + self.misses
+        return {
+            "size": size,
+            "maxsize": self.maxsize,
+            "persistent": self.store is not None,
+            "hits": self.hits,
+            "store_hits": self.store_hits,
+            "misses": self.misses,
+            "store_errors": self.store_errors,
+            "hit_rate": (self.hits + self.store_hits) / lookups if lookups else 0.0
+        }
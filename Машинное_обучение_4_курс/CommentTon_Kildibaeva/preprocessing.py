@@ -0,0 +1,174 @@
+import asyncio
+import multiprocessing
+import os
+import pickle
+import string
+import sys
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import pymorphy3
+from nltk.corpus import stopwords
+
+# Кэш лемм: максимальный размер и файл для прогрева при старте
+LEMMA_CACHE_SIZE = 100000
+LEMMA_CACHE_PATH = 'lemma_cache.pkl'
+
+# Наибольший размер части текстов, отправляемой в один процесс пула предобработки
+PREPROCESS_CHUNK_SIZE = 200
+
+morph = pymorphy3.MorphAnalyzer(lang='ru')
+russian_stopwords = stopwords.words("russian")
+russian_stopwords.extend(['т.д.', 'т', 'д', 'это', 'который', 'которые', 'которых', 'свой', 'своём', 'всем', 'всё',
+                          'её', 'оба', 'ещё', 'должный', 'должные', 'должных'])
+
+st = '\xa0—'
+custom_punctuation = string.punctuation + '«»'
+russian_stopwords_set = frozenset(russian_stopwords)
+
+# Таблица для str.translate: спецсимволы и цифры заменяются пробелом, пунктуация удаляется
+NORMALIZE_TABLE = {i: ' ' for i in range(sys.maxunicode + 1) if chr(i).isdigit()}
+NORMALIZE_TABLE.update({ord(ch): None for ch in custom_punctuation})
+NORMALIZE_TABLE.update({ord(ch): ' ' for ch in st})
+
+
+class LemmaCache:
+    """Ограниченный LRU-кэш словоформа → лемма поверх MorphAnalyzer"""
+
+    def __init__(self, analyzer, maxsize=LEMMA_CACHE_SIZE):
+        self.analyzer = analyzer
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def lemmatize(self, word):
+        """Возвращает лемму слова, обращаясь к pymorphy3 только при промахе"""
+        with self._lock:
+            lemma = self._data.get(word)
+            if lemma is not None:
+                self._data.move_to_end(word)
+                self.hits += 1
+                return lemma
+            self.misses += 1
+
+        try:
+            lemma = self.analyzer.parse(word)[0].normal_form
+        except:
+            lemma = word
+
+        with self._lock:
+            self._data[word] = lemma
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+        return lemma
+
+    def load(self, path):
+        """Прогрев кэша из файла, сохранённого методом save"""
+        with open(path, 'rb') as f:
+            items = pickle.load(f)
+        with self._lock:
+            for word, lemma in items[-self.maxsize:]:
+                self._data[word] = lemma
+
+    def save(self, path):
+        """Сохраняет содержимое кэша в порядке использования"""
+        with self._lock:
+            items = list(self._data.items())
+        with open(path, 'wb') as f:
+            pickle.dump(items, f)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0
+        }
+
+
+lemma_cache = LemmaCache(morph)
+
+
+def warm_up_lemma_cache(path=LEMMA_CACHE_PATH):
+    """Прогрев кэша лемм из файла, если он есть"""
+    if os.path.exists(path):
+        try:
+            lemma_cache.load(path)
+        except Exception as e:
+            print(f"Не удалось загрузить кэш лемм: {str(e)}")
+
+
+def normalize_words(text):
+    """Нормализация за один проход: регистр, символы, пунктуация, цифры, пробелы и стоп-слова"""
+    words = text.lower().translate(NORMALIZE_TABLE).split()
+    return [word for word in words if word not in russian_stopwords_set]
+
+
+def lemmatize_text(text):
+    """Лемматизация текста"""
+    if not isinstance(text, str) or not text.strip():
+        return text
+
+    return ' '.join(lemma_cache.lemmatize(word) for word in text.split())
+
+
+def preprocess_text(text):
+    """Полный цикл предобработки текста"""
+    if not isinstance(text, str) or not text.strip():
+        return ""
+
+    lemmatize = lemma_cache.lemmatize
+    return ' '.join([lemmatize(word) for word in normalize_words(text)]).strip()
+
+
+def preprocess_texts(texts):
+    """Предобработка списка текстов с сохранением порядка"""
+    return [preprocess_text(text) for text in texts]
+
+
+def create_preprocess_pool(processes):
+    """Пул процессов для массовой предобработки
+
+    Процессы запускаются через spawn и импортируют только этот модуль, поэтому
+    у каждого свой MorphAnalyzer, набор стоп-слов и кэш лемм, а модель не загружается.
+    Прогрев кэша выполняется один раз при старте процесса, а не на каждую задачу.
+    """
+    return ProcessPoolExecutor(
+        max_workers=processes,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=warm_up_lemma_cache,
+        initargs=(LEMMA_CACHE_PATH,)
+    )
+
+
+def split_chunks(texts, chunk_size):
+    return [texts[start:start + chunk_size] for start in range(0, len(texts), chunk_size)]
+
+
+def split_for_pool(texts, processes, max_chunk_size=PREPROCESS_CHUNK_SIZE):
+    """Делит тексты не менее чем на processes частей, чтобы порцию обрабатывали все процессы пула"""
+    chunk_size = min(max_chunk_size, -(-len(texts) // max(processes, 1)))
+    return split_chunks(texts, max(chunk_size, 1))
+
+
+def preprocess_texts_parallel(pool, texts, processes, max_chunk_size=PREPROCESS_CHUNK_SIZE):
+    """Предобработка частями в пуле процессов; порядок результатов совпадает с texts"""
+    processed = []
+    for part in pool.map(preprocess_texts, split_for_pool(texts, processes, max_chunk_size)):
+        processed.extend(part)
+    return processed
+
+
+async def preprocess_texts_parallel_async(pool, texts, processes, max_chunk_size=PREPROCESS_CHUNK_SIZE):
+    """То же, что preprocess_texts_parallel, без блокировки цикла событий"""
+    loop = asyncio.get_running_loop()
+    parts = await asyncio.gather(*[
+        loop.run_in_executor(pool, preprocess_texts, chunk)
+        for chunk in split_for_pool(texts, processes, max_chunk_size)
+    ])
+    return [text for part in parts for text in part]
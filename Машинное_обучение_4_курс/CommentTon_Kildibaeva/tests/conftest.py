@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# Модули сервиса лежат на уровень выше tests/ и импортируются как в main.py
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,128 @@
+"""Курсор bulk_worker.run на поддельном соединении: захват, продвижение, возврат к началу и отложенные порции
+
+Поддельное соединение разбирает только три запроса обработчика (захват порции, проверку
+очереди и UPDATE из build_tons_update); параллельную работу на настоящем MySQL проверяет
+tests/test_bulk_worker_mysql.py.
+"""
+import threading
+from contextlib import contextmanager
+
+import pytest
+
+import bulk_worker
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.result = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, params):
+        table = self.conn.table
+        if query.startswith("SELECT comment_id, comment_text"):
+            after_id, _, limit = params
+            self.conn.claims.append(after_id)
+            pending = [i for i in sorted(table.tons) if i > after_id and table.tons[i] is None]
+            self.result = [{'comment_id': i, 'comment_text': f"комментарий {i}"} for i in pending[:limit]]
+        elif query.startswith("SELECT comment_id FROM"):
+            _, limit = params
+            pending = [i for i in sorted(table.tons) if table.tons[i] is None]
+            self.result = [{'comment_id': i} for i in pending[:limit]]
+        elif query.startswith("UPDATE comments"):
+            n = query.count('WHEN %s') // 2
+            for comment_id, comment_ton in zip(params[0:2 * n:2], params[1:2 * n:2]):
+                table.tons[comment_id] = comment_ton
+        else:
+            raise AssertionError(query)
+
+    def fetchall(self):
+        return self.result
+
+
+class FakeConnection:
+    def __init__(self, table):
+        self.table = table
+        self.claims = table.claims
+
+    def begin(self):
+        pass
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def cursor(self):
+        return FakeCursor(self)
+
+
+class FakeTable:
+    """Таблица comments в памяти: comment_id -> тональность (None — не классифицирована)"""
+
+    def __init__(self, ids):
+        self.tons = {comment_id: None for comment_id in ids}
+        self.claims = []
+
+    @contextmanager
+    def connection(self):
+        yield FakeConnection(self)
+
+
+@pytest.fixture(autouse=True)
+def worker(monkeypatch):
+    monkeypatch.setattr(bulk_worker, 'stop_event', threading.Event())
+    monkeypatch.setattr(bulk_worker, 'WORKER_POLL_INTERVAL', 0)
+    monkeypatch.setattr(bulk_worker, 'classify_rows', lambda rows: [(row['comment_id'], 1, 0.75) for row in rows])
+
+
+def test_worker_advances_cursor_and_stops_when_queue_is_empty():
+    table = FakeTable(range(1, 8))
+    table.tons[4] = 0
+
+    assert bulk_worker.run(table, 2) == 6
+    assert table.tons == {1: 1, 2: 1, 3: 1, 4: 0, 5: 1, 6: 1, 7: 1}
+    # Курсор идёт по порциям, в конце таблицы возвращается к началу и завершает работу на пустом проходе
+    assert table.claims == [0, 2, 5, 7, 0]
+
+
+def test_worker_picks_up_rows_behind_cursor_on_next_pass(monkeypatch):
+    table = FakeTable(range(10, 15))
+    classify_rows = bulk_worker.classify_rows
+
+    def classify_and_insert(rows):
+        # Строка с меньшим comment_id появляется, когда курсор уже прошёл её
+        if rows[0]['comment_id'] == 12:
+            table.tons[3] = None
+        return classify_rows(rows)
+
+    monkeypatch.setattr(bulk_worker, 'classify_rows', classify_and_insert)
+
+    assert bulk_worker.run(table, 2) == 6
+    assert all(ton == 1 for ton in table.tons.values())
+    assert table.claims == [0, 11, 13, 14, 0, 3, 0]
+
+
+def test_failing_chunk_is_skipped_after_retries(monkeypatch):
+    table = FakeTable(range(1, 7))
+    attempts = []
+    classify_rows = bulk_worker.classify_rows
+
+    def classify_or_fail(rows):
+        if rows[0]['comment_id'] == 3:
+            attempts.append(rows[0]['comment_id'])
+            raise RuntimeError("ошибка порции")
+        return classify_rows(rows)
+
+    monkeypatch.setattr(bulk_worker, 'classify_rows', classify_or_fail)
+
+    # Без --follow обработчик завершается, хотя отложенные строки остаются в очереди
+    assert bulk_worker.run(table, 2) == 4
+    assert table.tons == {1: 1, 2: 1, 3: None, 4: None, 5: 1, 6: 1}
+    assert len(attempts) == bulk_worker.WORKER_MAX_CHUNK_FAILURES
@@ -0,0 +1,98 @@
+"""Несколько обработчиков bulk_worker на одной таблице: ни одна строка не классифицируется дважды
+
+Нужен локальный MySQL 8.0+ или MariaDB 10.6+ с параметрами из db.DB_CONFIG; тест создаёт
+(и пересоздаёт) отдельную базу из COMMENTTON_TEST_MYSQL_DB и без этой переменной пропускается:
+    docker run -d -p 3306:3306 -e MARIADB_ROOT_PASSWORD=1234 mariadb:11
+    COMMENTTON_TEST_MYSQL_DB=commentton_test COMMENTTON_BACKEND=numpy python -m pytest tests/test_bulk_worker_mysql.py
+"""
+import os
+import threading
+import time
+from collections import Counter
+
+import pytest
+
+TEST_DB = os.environ.get('COMMENTTON_TEST_MYSQL_DB')
+
+WORKERS = 4
+ROWS = 3000
+CHUNK_SIZE = 50
+
+pytestmark = pytest.mark.skipif(not TEST_DB, reason="COMMENTTON_TEST_MYSQL_DB не задана")
+
+
+@pytest.fixture
+def worker_db():
+    import pymysql
+    from db import DB_CONFIG
+
+    config = dict(DB_CONFIG)
+    del config['database']
+    try:
+        conn = pymysql.connect(**config)
+    except pymysql.MySQLError as e:
+        pytest.skip(f"MySQL недоступен: {e}")
+    with conn.cursor() as cursor:
+        cursor.execute(f"DROP DATABASE IF EXISTS `{TEST_DB}`")
+        cursor.execute(f"CREATE DATABASE `{TEST_DB}` CHARACTER SET utf8mb4")
+        cursor.execute(f"USE `{TEST_DB}`")
+        cursor.execute(
+            "CREATE TABLE comments (comment_id INT PRIMARY KEY, comment_text TEXT NOT NULL, "
+            "comment_ton INT NULL, probability FLOAT NULL, model_version VARCHAR(32) NULL, "
+            "classified_at DATETIME NULL)"
+        )
+    conn.commit()
+    yield conn, dict(DB_CONFIG, database=TEST_DB)
+    with conn.cursor() as cursor:
+        cursor.execute(f"DROP DATABASE IF EXISTS `{TEST_DB}`")
+    conn.close()
+
+
+def test_workers_never_classify_a_row_twice(worker_db, monkeypatch):
+    import bulk_worker
+    from db import ConnectionPool
+
+    conn, config = worker_db
+    # Каждая пятая строка уже классифицирована текущей версией — курсор должен её пропускать
+    rows = [(i, f"комментарий {i}", 0 if i % 5 == 0 else None, bulk_worker.MODEL_VERSION if i % 5 == 0 else None)
+            for i in range(1, ROWS + 1)]
+    with conn.cursor() as cursor:
+        cursor.executemany(
+            "INSERT INTO comments (comment_id, comment_text, comment_ton, model_version) VALUES (%s, %s, %s, %s)",
+            rows
+        )
+    conn.commit()
+
+    claimed = []
+    claimed_lock = threading.Lock()
+
+    def classify_rows(chunk):
+        with claimed_lock:
+            claimed.extend(row['comment_id'] for row in chunk)
+        # Даём другим обработчикам время столкнуться с заблокированными строками
+        time.sleep(0.005)
+        return [(row['comment_id'], 1, 0.75) for row in chunk]
+
+    monkeypatch.setattr(bulk_worker, 'classify_rows', classify_rows)
+    monkeypatch.setattr(bulk_worker, 'WORKER_POLL_INTERVAL', 0.05)
+
+    worker_config = dict(config, init_command=bulk_worker.WORKER_DB_CONFIG['init_command'])
+    pools = [ConnectionPool(worker_config, pool_size=1, max_overflow=0) for _ in range(WORKERS)]
+    threads = [threading.Thread(target=bulk_worker.run, args=(pool, CHUNK_SIZE)) for pool in pools]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(120)
+    for pool in pools:
+        pool.close()
+    assert not any(thread.is_alive() for thread in threads)
+
+    expected = {comment_id for comment_id, _, ton, _ in rows if ton is None}
+    repeated = [comment_id for comment_id, count in Counter(claimed).items() if count > 1]
+    assert repeated == []
+    assert set(claimed) == expected
+
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT COUNT(*) AS n FROM comments WHERE comment_ton = 1 AND model_version = %s",
+                       (bulk_worker.MODEL_VERSION,))
+        assert cursor.fetchone()['n'] == len(expected)
@@ -0,0 +1,83 @@
+import threading
+from contextlib import contextmanager
+
+import pytest
+
+import classifier_daemon
+
+
+class FakePool:
+    @contextmanager
+    def connection(self):
+        yield None
+
+
+class FakeTable:
+    """Таблица comments в памяти: comment_id -> тональность (None — не классифицирована)"""
+
+    def __init__(self, ids, stop_after):
+        self.tons = {comment_id: None for comment_id in ids}
+        self.fetches = 0
+        self.stop_after = stop_after
+        self.on_fetch = {}
+
+    def fetch(self, conn, last_id, limit):
+        self.fetches += 1
+        if self.fetches >= self.stop_after:
+            classifier_daemon.stop_event.set()
+        for comment_id in self.on_fetch.pop(self.fetches, []):
+            self.tons[comment_id] = None
+        pending = sorted(i for i, ton in self.tons.items() if i > last_id and ton is None)
+        return [{'comment_id': i, 'comment_text': f"комментарий {i}"} for i in pending[:limit]]
+
+    def process(self, conn, rows):
+        for row in rows:
+            self.tons[row['comment_id']] = 1
+
+
+@pytest.fixture
+def daemon(monkeypatch, tmp_path):
+    monkeypatch.setattr(classifier_daemon, 'stop_event', threading.Event())
+    monkeypatch.setattr(classifier_daemon, 'DAEMON_STATE_PATH', str(tmp_path / 'state.json'))
+    monkeypatch.setattr(classifier_daemon, 'DAEMON_POLL_INTERVAL', 0)
+    monkeypatch.setattr(classifier_daemon, 'DAEMON_MAX_ROWS_PER_SECOND', 0)
+    monkeypatch.setattr(classifier_daemon, 'DAEMON_BATCH_SIZE', 2)
+
+    def start(table):
+        monkeypatch.setattr(classifier_daemon, 'fetch_pending_rows', table.fetch)
+        monkeypatch.setattr(classifier_daemon, 'process_batch', table.process)
+        classifier_daemon.run(FakePool())
+
+    return start
+
+
+def test_rows_below_watermark_are_picked_up(daemon, monkeypatch):
+    monkeypatch.setattr(classifier_daemon, 'DAEMON_RESCAN_INTERVAL', 0)
+    classifier_daemon.save_watermark(10)
+    table = FakeTable([5] + list(range(11, 16)), stop_after=40)
+    # Строка с явным comment_id ниже отметки появляется, когда хвост уже разобран
+    table.on_fetch[20] = [7]
+    daemon(table)
+
+    assert all(ton == 1 for ton in table.tons.values())
+    assert classifier_daemon.load_watermark() == 15
+
+
+def test_failing_batch_is_skipped_after_retries(daemon, monkeypatch):
+    monkeypatch.setattr(classifier_daemon, 'DAEMON_RESCAN_INTERVAL', 3600)
+    table = FakeTable(range(1, 7), stop_after=20)
+    attempts = []
+
+    def process(conn, rows):
+        if rows[0]['comment_id'] == 3:
+            attempts.append(rows[0]['comment_id'])
+            raise RuntimeError("ошибка порции")
+        FakeTable.process(table, conn, rows)
+
+    table.process = process
+    daemon(table)
+
+    assert table.tons == {1: 1, 2: 1, 3: None, 4: None, 5: 1, 6: 1}
+    # Пропущенная порция повторяется ещё раз только при просмотре таблицы сначала (первый — сразу после старта)
+    assert len(attempts) == 2 * classifier_daemon.DAEMON_MAX_RETRIES
+    assert classifier_daemon.load_watermark() == 6
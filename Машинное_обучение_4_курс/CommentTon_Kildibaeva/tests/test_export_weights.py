@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+
+keras = pytest.importorskip('tensorflow').keras
+
+from export_weights import check_export, export_weights
+
+
+def save_model(tmp_path, layers, input_dim=20):
+    model = keras.Sequential([keras.Input(shape=(input_dim,))] + layers)
+    # Ненулевые случайные веса, в том числе смещения
+    rng = np.random.default_rng(0)
+    model.set_weights([rng.normal(size=w.shape).astype(np.float32) for w in model.get_weights()])
+    path = tmp_path / 'model.keras'
+    model.save(path)
+    return path
+
+
+@pytest.mark.parametrize('layers', [
+    [keras.layers.Dense(8, activation='relu'), keras.layers.Dropout(0.5), keras.layers.Dense(1, activation='sigmoid')],
+    [keras.layers.Dense(8, use_bias=False), keras.layers.Activation('relu'), keras.layers.Dense(1, use_bias=False),
+     keras.layers.Activation('sigmoid')],
+    [keras.layers.Dense(8, activation='tanh'), keras.layers.Activation('relu'), keras.layers.Dense(1),
+     keras.layers.Activation('sigmoid')],
+], ids=['dense-dropout', 'no-bias-activation-layers', 'activation-after-activation'])
+def test_export_matches_keras(tmp_path, layers):
+    path = save_model(tmp_path, layers)
+    model = export_weights(path, tmp_path / 'model.npz')
+    assert check_export(model, tmp_path / 'model.npz') < 1e-5
+
+
+def test_unsupported_layer_is_rejected(tmp_path):
+    path = save_model(tmp_path, [keras.layers.Dense(8), keras.layers.BatchNormalization(),
+                                 keras.layers.Dense(1, activation='sigmoid')])
+    with pytest.raises(ValueError, match='BatchNormalization'):
+        export_weights(path, tmp_path / 'model.npz')
@@ -0,0 +1,62 @@
+import time
+
+import pytest
+
+import jobs
+from jobs import JobHeartbeat, JobLost, JobStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return JobStore(str(tmp_path / 'jobs.db'))
+
+
+def make_stale(store, job_id):
+    with store._connect() as conn:
+        conn.execute("UPDATE jobs SET heartbeat_at = ? WHERE job_id = ?",
+                     (time.time() - jobs.JOB_STALE_SECONDS - 1, job_id))
+
+
+def test_only_one_job_runs_at_a_time(store):
+    first = store.create({})
+    store.create({})
+    assert store.claim_next('a')['job_id'] == first['job_id']
+    assert store.claim_next('b') is None
+
+
+def test_heartbeat_thread_keeps_a_slow_job_alive(store):
+    job = store.create({})
+    store.claim_next('a')
+    store.create({})
+    with JobHeartbeat(store, job['job_id'], 'a', interval=0.01) as heartbeat:
+        make_stale(store, job['job_id'])
+        time.sleep(0.2)
+        assert store.claim_next('b') is None
+    assert not heartbeat.lost
+    assert store.get(job['job_id'])['status'] == 'running'
+
+
+def test_worker_that_lost_its_job_stops_and_cannot_overwrite_it(store):
+    job = store.create({})
+    store.claim_next('a')
+    second = store.create({})
+    make_stale(store, job['job_id'])
+    assert store.claim_next('b')['job_id'] == second['job_id']
+    assert store.get(job['job_id'])['status'] == 'failed'
+
+    assert not store.heartbeat(job['job_id'], 'a')
+    with pytest.raises(JobLost):
+        store.update_progress(job['job_id'], 'a', 10, 5, 0, 1.0, 5)
+    store.finish(job['job_id'], 'a', 'done')
+    store.requeue(job['job_id'], 'a')
+    assert store.get(job['job_id'])['status'] == 'failed'
+
+
+def test_update_progress_reports_cancellation(store):
+    job = store.create({})
+    store.claim_next('a')
+    assert store.update_progress(job['job_id'], 'a', 10, 1, 0, 1.0, 1) is False
+    store.cancel(job['job_id'])
+    assert store.update_progress(job['job_id'], 'a', 10, 2, 0, 1.0, 2) is True
+    store.finish(job['job_id'], 'a', 'cancelled')
+    assert store.get(job['job_id'])['status'] == 'cancelled'
@@ -0,0 +1,77 @@
+import asyncio
+import threading
+
+import pytest
+
+from microbatcher import MicroBatcher
+
+
+def double_lengths(texts):
+    return [len(text) * 2 for text in texts]
+
+
+def test_predict_returns_result_per_text():
+    batcher = MicroBatcher(double_lengths, max_wait_ms=1)
+    assert batcher.predict("abc") == 6.0
+    assert batcher.predict("") == 0.0
+
+
+def test_concurrent_requests_share_a_batch():
+    batcher = MicroBatcher(double_lengths, max_batch_size=8, max_wait_ms=50)
+    futures = [batcher.submit("x" * i) for i in range(8)]
+    assert [future.result(timeout=5) for future in futures] == [2.0 * i for i in range(8)]
+    assert batcher.stats()["batch_size"]["count"] == 1
+
+
+def test_cancelled_caller_does_not_stop_the_batcher():
+    batcher = MicroBatcher(double_lengths, max_wait_ms=50)
+
+    async def scenario():
+        cancelled = asyncio.ensure_future(batcher.predict_async("отменён"))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await cancelled
+        return await asyncio.wait_for(batcher.predict_async("после"), timeout=5)
+
+    assert asyncio.run(scenario()) == 10.0
+    assert batcher._thread.is_alive()
+
+
+def test_caller_cancelled_during_model_pass():
+    started = threading.Event()
+    release = threading.Event()
+
+    def slow(texts):
+        started.set()
+        release.wait(5)
+        return double_lengths(texts)
+
+    batcher = MicroBatcher(slow, max_wait_ms=1)
+
+    async def scenario():
+        task = asyncio.ensure_future(batcher.predict_async("долгий"))
+        await asyncio.get_running_loop().run_in_executor(None, started.wait, 5)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        release.set()
+        return await asyncio.wait_for(batcher.predict_async("ok"), timeout=5)
+
+    assert asyncio.run(scenario()) == 4.0
+    assert batcher._thread.is_alive()
+
+
+def test_model_error_is_passed_to_callers():
+    calls = []
+
+    def failing_once(texts):
+        calls.append(texts)
+        if len(calls) == 1:
+            raise RuntimeError("модель недоступна")
+        return double_lengths(texts)
+
+    batcher = MicroBatcher(failing_once, max_wait_ms=1)
+    with pytest.raises(RuntimeError):
+        batcher.predict("a")
+    assert batcher.predict("ab") == 4.0
@@ -0,0 +1,71 @@
+from contextlib import contextmanager
+
+import prediction_cache
+from prediction_cache import PredictionCache, PredictionCacheStore, text_key
+
+
+class FakeCursor:
+    def __init__(self, rows, statements):
+        self.rows = rows
+        self.statements = statements
+        self.result = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, params):
+        self.statements.append(len(params))
+        if query.startswith("SELECT"):
+            model_version, keys = params[0], params[1:]
+            self.result = [{'text_hash': key, 'probability': self.rows[key, model_version]}
+                           for key in keys if (key, model_version) in self.rows]
+        else:
+            for i in range(0, len(params), 3):
+                key, model_version, probability = params[i:i + 3]
+                self.rows.setdefault((key, model_version), probability)
+
+    def fetchall(self):
+        return self.result
+
+
+class FakePool:
+    def __init__(self):
+        self.rows = {}
+        self.statements = []
+
+    @contextmanager
+    def connection(self):
+        conn = type('FakeConnection', (), {})()
+        conn.cursor = lambda: FakeCursor(self.rows, self.statements)
+        conn.commit = lambda: None
+        yield conn
+
+
+def test_store_splits_large_batches(monkeypatch):
+    monkeypatch.setattr(prediction_cache, 'STORE_CHUNK_SIZE', 4)
+    pool = FakePool()
+    store = PredictionCacheStore(pool, 'v1')
+    items = [(text_key(f"текст {i}"), i / 10) for i in range(10)]
+
+    store.put_many(items)
+    assert pool.statements == [12, 12, 6]
+
+    pool.statements.clear()
+    found = store.get_many([key for key, _ in items] + [text_key("нет в кэше")])
+    assert found == dict(items)
+    assert pool.statements == [5, 5, 4]
+    assert PredictionCacheStore(pool, 'v2').get_many([key for key, _ in items]) == {}
+
+
+def test_cache_reads_through_to_store():
+    store = PredictionCacheStore(FakePool(), 'v1')
+    key = text_key("текст")
+    PredictionCache(maxsize=10, store=store).put_many([(key, 0.25)])
+
+    cache = PredictionCache(maxsize=10, store=store)
+    assert cache.get_many([key, text_key("другой")]) == {key: 0.25}
+    assert cache.stats()['store_hits'] == 1
+    assert cache.stats()['misses'] == 1
@@ -0,0 +1,41 @@
+import json
+from pathlib import Path
+
+import pytest
+
+import preprocessing
+
+# Пары (текст, результат), полученные прежней цепочкой из пяти этапов
+# (remove_othersymbol → remove_punctuation → remove_numbers →
+# remove_multiple_spaces → remove_stopwords → lemmatize_text); tfidf.pkl обучен на них
+GOLDEN = json.loads((Path(__file__).parent / 'data' / 'preprocessing_golden.json').read_text(encoding='utf-8'))
+
+
+@pytest.mark.parametrize('text, expected', GOLDEN)
+def test_preprocess_text_matches_previous_chain(text, expected):
+    assert preprocessing.preprocess_text(text) == expected
+
+
+def test_preprocess_text_same_with_warm_lemma_cache():
+    texts = [text for text, _ in GOLDEN]
+    first = preprocessing.preprocess_texts(texts)
+    second = preprocessing.preprocess_texts(texts)
+    assert first == second == [expected for _, expected in GOLDEN]
+
+
+@pytest.mark.parametrize('value', [None, 42, '', ' \xa0\n'])
+def test_preprocess_text_empty_or_not_a_string(value):
+    assert preprocessing.preprocess_text(value) == ""
+
+
+@pytest.mark.parametrize('n_texts, processes, sizes', [
+    (500, 8, [63] * 7 + [59]),
+    (500, 2, [200, 200, 100]),
+    (3, 8, [1, 1, 1]),
+    (0, 4, []),
+])
+def test_split_for_pool_uses_every_process(n_texts, processes, sizes):
+    texts = [str(i) for i in range(n_texts)]
+    chunks = preprocessing.split_for_pool(texts, processes)
+    assert [len(chunk) for chunk in chunks] == sizes
+    assert [text for chunk in chunks for text in chunk] == texts
@@ -0,0 +1,63 @@
+import json
+import pickle
+import random
+from pathlib import Path
+
+import numpy as np
+import pytest
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from vectorizer import FusedVectorizer
+
+SERVICE_DIR = Path(__file__).resolve().parent.parent
+
+
+@pytest.fixture(scope='module')
+def tfidf():
+    with open(SERVICE_DIR / 'tfidf.pkl', 'rb') as f:
+        return pickle.load(f)
+
+
+def sample_texts(tfidf, n_texts=300, seed=0):
+    """Предобработанные тексты из golden-набора и случайные последовательности слов словаря"""
+    golden = json.loads((Path(__file__).parent / 'data' / 'preprocessing_golden.json').read_text(encoding='utf-8'))
+    texts = [expected for _, expected in golden]
+    rng = random.Random(seed)
+    words = sorted({word for term in tfidf.vocabulary_ for word in term.split(' ')})
+    extra = ['неизвестноеслово', 'я', 'a1', 'ПРИВЕТ', '42', 'слово-слово']
+    for _ in range(n_texts):
+        length = rng.randint(0, 30)
+        texts.append(' '.join(rng.choice(words) if rng.random() < 0.9 else rng.choice(extra) for _ in range(length)))
+    texts += ['', ' ', 'неизвестноеслово другоеслово']
+    return texts
+
+
+def assert_same_csr(actual, expected):
+    assert actual.shape == expected.shape
+    assert np.array_equal(actual.indptr, expected.indptr)
+    assert np.array_equal(actual.indices, expected.indices)
+    # Сравнение на точное равенство: модель обучена на выходе sklearn
+    assert np.array_equal(actual.data, expected.data)
+
+
+def test_fused_vectorizer_matches_trained_tfidf(tfidf):
+    texts = sample_texts(tfidf)
+    fused = FusedVectorizer.from_sklearn(tfidf)
+    expected = tfidf.transform(texts)
+    assert_same_csr(fused.transform(texts), expected)
+    # Повторный проход идёт через кэш разобранных слов
+    assert_same_csr(fused.transform(texts), expected)
+
+
+def test_fused_vectorizer_matches_unigram_tfidf():
+    corpus = ['Кот сидит на окне', 'собака лает на кота', 'кот и собака', 'окно открыто']
+    tfidf = TfidfVectorizer(ngram_range=(1, 1)).fit(corpus)
+    texts = corpus + ['КОТ кот кот', 'ничего знакомого', '']
+    expected = tfidf.transform(texts)
+    assert_same_csr(FusedVectorizer.from_sklearn(tfidf).transform(texts), expected)
+
+
+def test_unsupported_parameters_are_rejected():
+    tfidf = TfidfVectorizer(sublinear_tf=True).fit(['кот сидит', 'собака лает'])
+    with pytest.raises(ValueError, match='sublinear_tf'):
+        FusedVectorizer.from_sklearn(tfidf)
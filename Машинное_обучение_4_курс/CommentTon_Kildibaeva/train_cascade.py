@@ -0,0 +1,106 @@
+"""Обучение и калибровка быстрого уровня каскада (model_fast.npz)
+
+Логистическая регрессия обучается на тех же признаках TF-IDF, что и основная
+модель, на обучающей части размеченных данных (колонки comment и toxic, как
+в labeled.csv). Отложенная часть делится пополам: на калибровочной половине
+подбирается самая узкая полоса неуверенности, при которой итоговые метки
+каскада совпадают с метками основной модели не реже TARGET_AGREEMENT, а на
+оценочной половине, не участвовавшей в выборе, считаются метрики этой полосы.
+
+Запуск: python train_cascade.py labeled.csv [model_fast.npz]
+"""
+import sys
+import numpy as np
+import pandas as pd
+from sklearn.linear_model import LogisticRegression
+from sklearn.model_selection import train_test_split
+from classifier import TFIDF_PATH, file_digest, model, tfidf, predict_full
+from numpy_backend import LinearModel
+from preprocessing import preprocess_texts
+
+TARGET_AGREEMENT = 0.99
+TEST_SIZE = 0.2
+# Доля отложенной выборки, на которой подбирается полоса; остальное — для оценки
+CALIBRATION_SIZE = 0.5
+
+# Кандидаты границ полосы: low из [0; 0.5], high из [0.5; 1]
+BAND_STEPS = np.round(np.arange(0, 0.51, 0.025), 3)
+
+
+def evaluate(fast_probabilities, full_probabilities, labels, low, high):
+    """Метрики каскада с полосой (low, high) на переданной выборке"""
+    uncertain = (fast_probabilities > low) & (fast_probabilities < high)
+    cascade_probabilities = np.where(uncertain, full_probabilities, fast_probabilities)
+    cascade_labels = cascade_probabilities > 0.5
+    return {
+        "low": low,
+        "high": high,
+        "full_share": float(uncertain.mean()),
+        "agreement": float((cascade_labels == (full_probabilities > 0.5)).mean()),
+        "accuracy": float((cascade_labels == labels).mean())
+    }
+
+
+def calibrate(fast_probabilities, full_probabilities, labels):
+    """Полоса с наименьшей долей текстов для основной модели при нужном согласии"""
+    candidates = [
+        evaluate(fast_probabilities, full_probabilities, labels, low, round(1 - margin, 3))
+        for low in BAND_STEPS for margin in BAND_STEPS
+    ]
+    suitable = [c for c in candidates if c['agreement'] >= TARGET_AGREEMENT]
+    if not suitable:
+        return evaluate(fast_probabilities, full_probabilities, labels, 0.0, 1.0)
+    return min(suitable, key=lambda c: (c['full_share'], -c['agreement']))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        sys.exit("Запуск: python train_cascade.py labeled.csv [model_fast.npz]")
+    data_path = sys.argv[1]
+    output_path = sys.argv[2] if len(sys.argv) > 2 else 'model_fast.npz'
+
+    if model is None:
+        sys.exit("Основная модель не загружена")
+
+    df = pd.read_csv(data_path)
+    texts = [text or "пустой комментарий" for text in preprocess_texts(df['comment'].tolist())]
+    labels = df['toxic'].astype(int).to_numpy()
+    matrix = tfidf.transform(texts)
+
+    train_index, test_index = train_test_split(
+        np.arange(len(labels)), test_size=TEST_SIZE, random_state=42, stratify=labels)
+
+    regression = LogisticRegression(max_iter=1000)
+    regression.fit(matrix[train_index], labels[train_index])
+    fast_model = LinearModel(regression.coef_[0], regression.intercept_[0])
+
+    test_matrix = matrix[test_index]
+    test_labels = labels[test_index].astype(bool)
+    fast_probabilities = fast_model.predict_sparse(test_matrix)
+    full_probabilities = predict_full(test_matrix)
+
+    calibration_index, evaluation_index = train_test_split(
+        np.arange(len(test_index)), train_size=CALIBRATION_SIZE, random_state=42, stratify=test_labels)
+    calibration = (fast_probabilities[calibration_index], full_probabilities[calibration_index],
+                   test_labels[calibration_index])
+    evaluation = (fast_probabilities[evaluation_index], full_probabilities[evaluation_index],
+                  test_labels[evaluation_index])
+
+    print(f"Калибровка: {len(calibration_index)} текстов, оценка: {len(evaluation_index)} текстов")
+    print(f"Точность основной модели: {((evaluation[1] > 0.5) == evaluation[2]).mean():.4f}")
+    print(f"Точность логистической регрессии: {((evaluation[0] > 0.5) == evaluation[2]).mean():.4f}")
+    print("Полоса        доля в основную  согласие  точность")
+    for low, high in [(0.5, 0.5), (0.4, 0.6), (0.3, 0.7), (0.2, 0.8), (0.1, 0.9), (0.05, 0.95)]:
+        r = evaluate(*evaluation, low, high)
+        print(f"({low:.2f}, {high:.2f})  {r['full_share']:15.3f}  {r['agreement']:8.4f}  {r['accuracy']:8.4f}")
+
+    chosen = calibrate(*calibration)
+    best = evaluate(*evaluation, chosen['low'], chosen['high'])
+    print(f"Выбрана полоса ({best['low']}, {best['high']}) по калибровочной части "
+          f"(согласие {chosen['agreement']:.4f}); на оценочной части: в основную модель "
+          f"{best['full_share']:.1%} текстов, согласие {best['agreement']:.4f}, точность {best['accuracy']:.4f}")
+
+    np.savez(output_path, coef=fast_model.coef, intercept=np.array(fast_model.intercept),
+             band_low=np.array(best['low']), band_high=np.array(best['high']),
+             source_digest=np.array(file_digest(TFIDF_PATH)))
+    print(f"Быстрая модель сохранена в {output_path}")
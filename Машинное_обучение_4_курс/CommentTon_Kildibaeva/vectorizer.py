@@ -0,0 +1,113 @@
+import math
+import re
+
+import numpy as np
+import scipy.sparse as sp
+
+# Сколько разобранных слов (слово → токены и их индексы) держать в памяти
+WORD_CACHE_SIZE = 100000
+
+
+class FusedVectorizer:
+    """Векторизация TF-IDF по словарю и весам обученного TfidfVectorizer
+
+    Предобработанный текст уже является потоком лемм через пробел, поэтому
+    токены берутся разбиением по пробелам (каждое слово разбирается token_pattern
+    один раз и запоминается), униграммы ищутся по индексу, а биграммы — во
+    вложенном словаре «первое слово → второе слово → столбец» без склейки строк.
+    Результат совпадает с tfidf.transform: те же столбцы, idf и l2-нормировка.
+    Хранит только словари с int-индексами и веса idf, без остальных атрибутов
+    sklearn-объекта.
+    """
+
+    def __init__(self, vocabulary, idf, token_pattern=r"(?u)\b\w\w+\b", lowercase=True):
+        self.unigrams = {}
+        self.bigrams = {}
+        for term, index in vocabulary.items():
+            words = term.split(' ')
+            if len(words) == 1:
+                self.unigrams[term] = int(index)
+            elif len(words) == 2:
+                self.bigrams.setdefault(words[0], {})[words[1]] = int(index)
+            else:
+                raise ValueError(f"Поддерживаются только униграммы и биграммы: {term!r}")
+        self.idf = [float(value) for value in idf]
+        self.n_features = len(self.idf)
+        self.lowercase = lowercase
+        self._token_re = re.compile(token_pattern)
+        self._words = {}
+
+    @classmethod
+    def from_sklearn(cls, tfidf):
+        """Собирает векторизатор из обученного TfidfVectorizer с поддерживаемыми параметрами"""
+        unsupported = {
+            'analyzer': tfidf.analyzer != 'word',
+            'ngram_range': tfidf.ngram_range not in ((1, 1), (1, 2)),
+            'norm': tfidf.norm != 'l2',
+            'use_idf': not tfidf.use_idf,
+            'sublinear_tf': tfidf.sublinear_tf,
+            'binary': tfidf.binary,
+            'stop_words': tfidf.stop_words is not None,
+            'preprocessor': tfidf.preprocessor is not None,
+            'tokenizer': tfidf.tokenizer is not None,
+            'strip_accents': tfidf.strip_accents is not None
+        }
+        unsupported = [name for name, flag in unsupported.items() if flag]
+        if unsupported:
+            raise ValueError(f"Параметры TfidfVectorizer не поддерживаются: {unsupported}")
+        return cls(tfidf.vocabulary_, tfidf.idf_, tfidf.token_pattern, tfidf.lowercase)
+
+    def _word_tokens(self, word):
+        """Токены слова в виде пар (токен, индекс униграммы или -1)"""
+        tokens = self._words.get(word)
+        if tokens is None:
+            text = word.lower() if self.lowercase else word
+            tokens = tuple((token, self.unigrams.get(token, -1)) for token in self._token_re.findall(text))
+            if len(self._words) >= WORD_CACHE_SIZE:
+                self._words.clear()
+            self._words[word] = tokens
+        return tokens
+
+    def transform(self, processed_texts):
+        """CSR-матрица TF-IDF для списка предобработанных текстов"""
+        return self.transform_tokens(text.split() for text in processed_texts)
+
+    def transform_tokens(self, documents):
+        """CSR-матрица TF-IDF для последовательностей слов (лемм) каждого документа"""
+        indices = []
+        data = []
+        indptr = [0]
+        bigrams = self.bigrams
+        idf = self.idf
+        for words in documents:
+            row = {}
+            previous = None
+            for word in words:
+                for token, index in self._word_tokens(word):
+                    if index >= 0:
+                        row[index] = row.get(index, 0) + 1
+                    if previous is not None:
+                        following = bigrams.get(previous)
+                        if following is not None:
+                            column = following.get(token)
+                            if column is not None:
+                                row[column] = row.get(column, 0) + 1
+                    previous = token
+            columns = sorted(row)
+            values = [row[column] * idf[column] for column in columns]
+            # l2-нормировка: суммирование по возрастанию столбцов, как в sklearn, даёт те же биты
+            norm = 0.0
+            for value in values:
+                norm += value * value
+            norm = math.sqrt(norm)
+            indices.extend(columns)
+            data.extend([value / norm for value in values])
+            indptr.append(len(indices))
+
+        matrix = sp.csr_matrix(
+            (np.asarray(data, dtype=np.float64), np.asarray(indices, dtype=np.int32),
+             np.asarray(indptr, dtype=np.int32)),
+            shape=(len(indptr) - 1, self.n_features)
+        )
+        matrix.has_sorted_indices = True
+        return matrix
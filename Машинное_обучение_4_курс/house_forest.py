@@ -0,0 +1,186 @@
+import numpy as np
+import sklearn
+
+# До sklearn 1.4 листья классификатора хранят число объектов, и predict_proba
+# делит их на сумму по строке; начиная с 1.4 в листьях уже лежат доли
+NORMALIZE_LEAF_PROBA = tuple(int(part) for part in sklearn.__version__.split('.')[:2]) < (1, 4)
+
+# Сколько случайных строк сравнивать с sklearn при проверке после компиляции
+VERIFY_ROWS = 512
+
+
+def partition_estimators(n_estimators, n_jobs):
+    """Границы групп деревьев по заданиям, как их делит BaggingRegressor.predict"""
+    try:
+        from sklearn.ensemble._base import _partition_estimators
+        _, _, starts = _partition_estimators(n_estimators, n_jobs)
+    except ImportError:
+        starts = [0, n_estimators]
+    return list(zip(starts[:-1], starts[1:]))
+
+
+class CompiledForest:
+    """Ансамбль деревьев sklearn, развёрнутый в общие массивы узлов NumPy
+
+    Узлы всех деревьев лежат подряд в массивах feature/threshold/left/right/value.
+    Оба потомка листа указывают на сам лист, поэтому пакет строк проходит все
+    деревья одновременно, по одному уровню за шаг, без ветвлений; пути, дошедшие
+    до листа, на следующих уровнях уже не обрабатываются. Лист определяется только
+    по этой ссылке на себя: порог +inf бывает и у внутренних узлов деревьев,
+    обученных на данных с пропусками (sklearn 1.3+ отправляет так NaN в одну ветвь).
+    Признаки приводятся к float32, а ответы деревьев складываются в том же
+    порядке, что и в sklearn, поэтому предсказания совпадают до бита.
+    """
+
+    def __init__(self, feature, threshold, left, right, missing_left, value, roots, depth,
+                 groups, divisor, n_features, feature_names=None, classes=None):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        # Потомки узла i: children[2 * i] — правый, children[2 * i + 1] — левый
+        self.children = np.ascontiguousarray(np.stack([right, left], axis=1).ravel())
+        self.is_leaf = left == np.arange(len(left))
+        self.missing_left = missing_left
+        self.value = value
+        self.roots = roots
+        self.depth = depth
+        # Группы деревьев (начало, конец), суммируемые по отдельности, и делитель среднего
+        self.groups = groups
+        self.divisor = divisor
+        self.n_features_in_ = n_features
+        self.feature_names_in_ = feature_names
+        self.classes_ = classes
+
+    @classmethod
+    def from_sklearn(cls, model):
+        """Компилирует BaggingRegressor над деревьями или случайный лес sklearn"""
+        estimators = getattr(model, 'estimators_', None)
+        if not estimators:
+            raise ValueError(f"Модель {type(model).__name__} не является обученным ансамблем")
+        classes = getattr(model, 'classes_', None)
+        n_features = model.n_features_in_
+        estimators_features = getattr(model, 'estimators_features_', None)
+        if estimators_features is not None:
+            if classes is not None:
+                raise ValueError("Бэггинг классификаторов не поддерживается")
+            groups = partition_estimators(model.n_estimators, model.n_jobs)
+            divisor = model.n_estimators
+        else:
+            estimators_features = [np.arange(n_features)] * len(estimators)
+            groups = [(0, len(estimators))]
+            divisor = len(estimators)
+
+        parts = {name: [] for name in ('feature', 'threshold', 'left', 'right', 'missing_left', 'value')}
+        roots = []
+        depth = 0
+        offset = 0
+        for estimator, features in zip(estimators, estimators_features):
+            tree = getattr(estimator, 'tree_', None)
+            if tree is None or tree.n_outputs != 1:
+                raise ValueError(f"Поддерживаются только деревья с одним выходом: {type(estimator).__name__}")
+            nodes = np.arange(tree.node_count)
+            leaf = tree.children_left == -1
+            parts['feature'].append(np.where(leaf, 0, np.asarray(features)[np.maximum(tree.feature, 0)]))
+            parts['threshold'].append(np.where(leaf, np.inf, tree.threshold))
+            parts['left'].append(np.where(leaf, nodes, tree.children_left) + offset)
+            parts['right'].append(np.where(leaf, nodes, tree.children_right) + offset)
+            missing = getattr(tree, 'missing_go_to_left', None)
+            parts['missing_left'].append(np.zeros(tree.node_count, dtype=bool) if missing is None
+                                         else np.asarray(missing, dtype=bool))
+            if classes is None:
+                parts['value'].append(tree.value[:, 0, 0])
+            else:
+                proba = tree.value[:, 0, :len(classes)].copy()
+                if NORMALIZE_LEAF_PROBA:
+                    normalizer = proba.sum(axis=1)[:, np.newaxis]
+                    normalizer[normalizer == 0.0] = 1.0
+                    proba /= normalizer
+                parts['value'].append(proba)
+            roots.append(offset)
+            depth = max(depth, tree.max_depth)
+            offset += tree.node_count
+
+        arrays = {name: np.ascontiguousarray(np.concatenate(chunks)) for name, chunks in parts.items()}
+        return cls(
+            arrays['feature'].astype(np.intp), arrays['threshold'].astype(np.float64),
+            arrays['left'].astype(np.intp), arrays['right'].astype(np.intp),
+            arrays['missing_left'], arrays['value'].astype(np.float64),
+            np.asarray(roots, dtype=np.intp), depth, groups, divisor, n_features,
+            getattr(model, 'feature_names_in_', None), classes
+        )
+
+    def _prepare(self, X):
+        if hasattr(X, 'columns') and self.feature_names_in_ is not None:
+            X = X[list(self.feature_names_in_)]
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim != 2 or X.shape[1] != self.n_features_in_:
+            raise ValueError(f"Ожидается матрица с {self.n_features_in_} признаками, получено {X.shape}")
+        return X
+
+    def apply(self, X):
+        """Номера листьев (в общих массивах) для каждого дерева и строки: (деревья, строки)"""
+        X = self._prepare(X)
+        n_rows, n_features = X.shape
+        # Сравнение float32-признака с float64-порогом, как в sklearn
+        flat = X.astype(np.float64).ravel()
+        has_missing = bool(np.isnan(flat).any())
+        nodes = np.repeat(self.roots, n_rows)
+        # Пути, ещё не дошедшие до листа: их позиции в nodes, текущие узлы и смещения строк
+        active = np.arange(len(nodes))
+        current = nodes.copy()
+        row_offsets = np.tile(np.arange(n_rows) * n_features, len(self.roots))
+        for _ in range(self.depth):
+            values = flat[row_offsets + self.feature[current]]
+            go_left = values <= self.threshold[current]
+            if has_missing:
+                go_left |= np.isnan(values) & self.missing_left[current]
+            current = self.children[2 * current + go_left]
+            done = self.is_leaf[current]
+            if done.any():
+                nodes[active[done]] = current[done]
+                pending = ~done
+                active, current, row_offsets = active[pending], current[pending], row_offsets[pending]
+                if not len(active):
+                    break
+        return nodes.reshape(len(self.roots), n_rows)
+
+    def _average(self, values):
+        # Суммы по группам и затем между группами, в порядке sklearn
+        return sum(sum(values[start:end]) for start, end in self.groups) / self.divisor
+
+    def predict(self, X):
+        if self.classes_ is not None:
+            return self.classes_.take(np.argmax(self.predict_proba(X), axis=1))
+        return self._average(self.value[self.apply(X)])
+
+    def predict_proba(self, X):
+        if self.classes_ is None:
+            raise AttributeError("predict_proba доступен только для классификатора")
+        return self._average(self.value[self.apply(X)])
+
+    def sample_rows(self, n_rows=VERIFY_ROWS, seed=0):
+        """Случайные строки вокруг порогов деревьев, включая сами пороги"""
+        rng = np.random.default_rng(seed)
+        X = np.zeros((n_rows, self.n_features_in_))
+        internal = ~self.is_leaf & np.isfinite(self.threshold)
+        for column in range(self.n_features_in_):
+            thresholds = self.threshold[internal & (self.feature == column)]
+            if len(thresholds):
+                base = rng.choice(thresholds, n_rows)
+                X[:, column] = base + rng.choice([-1.0, -1e-3, 0.0, 1e-3, 1.0], n_rows) * np.maximum(1, np.abs(base))
+        return X.astype(np.float32)
+
+    def verify(self, model, n_rows=VERIFY_ROWS):
+        """Проверяет побитовое совпадение с исходной моделью sklearn"""
+        X = self.sample_rows(n_rows)
+        if self.feature_names_in_ is not None:
+            import pandas as pd
+            X = pd.DataFrame(X, columns=self.feature_names_in_)
+        if self.classes_ is None:
+            expected, actual = model.predict(X), self.predict(X)
+        else:
+            expected, actual = model.predict_proba(X), self.predict_proba(X)
+        if not np.array_equal(expected, actual):
+            raise ValueError(f"Предсказания не совпадают с sklearn, максимальное расхождение "
+                             f"{np.max(np.abs(expected - actual))}")
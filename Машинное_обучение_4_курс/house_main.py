@@ -1,11 +1,28 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 import pickle
+import codecs
+import csv
+import functools
+import io
+import itertools
+import json
+import operator
+import tempfile
+import threading
+import time
+from collections import OrderedDict
 from pydantic import BaseModel
 import pandas as pd
 import numpy as np
 import warnings
 import sklearn
 import os
+import re
+from house_forest import CompiledForest
+# Реестр метрик и middleware общие с сервисом CommentTon
+from CommentTon_Kildibaeva.metrics import LATENCY_BUCKETS, PrometheusMiddleware, StageTimer, registry
 
 # Отключаем параллельное выполнение для избежания ошибок
 os.environ['OMP_NUM_THREADS'] = '1'
@@ -14,24 +31,70 @@ os.environ['MKL_NUM_THREADS'] = '1'
 os.environ['VECLIB_MAXIMUM_THREADS'] = '1'
 os.environ['NUMEXPR_NUM_THREADS'] = '1'
 
+try:
+    import pyarrow.parquet as pq
+except ImportError:
+    pq = None
+
 warnings.filterwarnings("ignore")
 
+# Строк в блоке пакетного предсказания: один вызов модели на блок
+BATCH_CHUNK_SIZE = 5000
+# Загрузки больше этого размера (байт) при приёме сбрасываются во временный файл
+UPLOAD_SPOOL_SIZE = 16 * 1024 * 1024
+# Сколько байт JSON-массива читать за раз при потоковом разборе
+JSON_READ_SIZE = 64 * 1024
+# Наибольший размер (символов) одного элемента JSON-массива: буфер разбора не растёт без предела
+JSON_MAX_ELEMENT_SIZE = 1024 * 1024
+# Необязательный столбец-идентификатор, который копируется в ответ пакетных эндпоинтов
+BATCH_ID_COLUMN = 'id'
+
+# Наибольшее число точек сетки в /predict-price/sweep
+SWEEP_MAX_POINTS = 10000
+# Границы целого признака в sweep: признаки передаются модели как float64, где целые
+# больше 2**53 уже не представимы точно (и значения сетки не помещаются в int64)
+SWEEP_MAX_INT = 2 ** 53
+# Сколько последних предсказаний каждой модели хранить в кэше
+PREDICTION_CACHE_SIZE = 10000
+# Как часто (с) проверять, не заменены ли файлы моделей на диске
+MODEL_CHECK_INTERVAL = 5.0
+
+stage_seconds = registry.histogram('house_stage_seconds', 'Длительность этапов обработки', LATENCY_BUCKETS,
+                                   ('stage',))
+prediction_errors = registry.counter('house_prediction_errors_total',
+                                     'Ошибки модели, скрытые safe_predict_* за значением по умолчанию', ('model',))
+cache_requests = registry.counter('house_prediction_cache_requests_total', 'Обращения к кэшу предсказаний',
+                                  ('model', 'result'))
+cache_size = registry.gauge('house_prediction_cache_size', 'Записи в кэше предсказаний', ('model',))
+model_load_seconds = registry.gauge('house_model_load_seconds', 'Время загрузки файла модели', ('file',))
+model_compile_seconds = registry.gauge('house_model_compile_seconds', 'Время компиляции ансамбля деревьев',
+                                       ('model',))
+startup_seconds = registry.gauge('house_startup_seconds', 'Время запуска сервиса после загрузки моделей')
+
+
+def stage(name):
+    """Время этапа обработки: with stage('predict'): ..."""
+    return StageTimer(stage_seconds.labels(name))
+
+
+INIT_STARTED = time.perf_counter()
+
 app = FastAPI()
+app.add_middleware(PrometheusMiddleware, registry=registry, prefix='house')
 
 
 # Функция для безопасной загрузки моделей с исправлением атрибутов
 def load_model_with_fix(filepath):
+    started = time.perf_counter()
     try:
         with open(filepath, 'rb') as file:
             model = pickle.load(file)
 
-        # Исправляем отсутствующий атрибут monotonic_cst для деревьев
+        # Исправляем атрибут monotonic_cst для деревьев один раз при загрузке,
+        # а не перед каждым предсказанием
         if hasattr(model, 'estimators_') and model.estimators_ is not None:
             for estimator in model.estimators_:
-                if hasattr(estimator, 'monotonic_cst'):
-                    delattr(estimator, 'monotonic_cst')
-                elif not hasattr(estimator, 'monotonic_cst'):
-                    estimator.monotonic_cst = None
+                estimator.monotonic_cst = None
 
         # Для одиночных деревьев
         if hasattr(model, 'monotonic_cst'):
@@ -39,6 +102,7 @@ def load_model_with_fix(filepath):
         elif not hasattr(model, 'monotonic_cst'):
             model.monotonic_cst = None
 
+        model_load_seconds.set(os.path.basename(filepath), value=time.perf_counter() - started)
         return model
 
     except Exception as e:
@@ -46,9 +110,33 @@ def load_model_with_fix(filepath):
         return None
 
 
+# Файлы моделей; заменённый файл подхватывается без перезапуска (reload_changed_models)
+BR_MODEL_PATH = 'C:\\Users\\Huawei\\Downloads\\model_reg_br_fasts3.pkl'
+RF_MODEL_PATH = 'C:\\Users\\Huawei\\Downloads\\model_clas_rf_fasts3.pkl'
+
 # Загружаем модели с исправлениями
-br = load_model_with_fix('C:\\Users\\Huawei\\Downloads\\model_reg_br_fasts3.pkl')
-rf = load_model_with_fix('C:\\Users\\Huawei\\Downloads\\model_clas_rf_fasts3.pkl')
+br = load_model_with_fix(BR_MODEL_PATH)
+rf = load_model_with_fix(RF_MODEL_PATH)
+
+
+def compile_model(model, name):
+    """Компилирует ансамбль в массивы узлов; при ошибке или расхождении остаётся sklearn"""
+    if model is None:
+        return None
+    started = time.perf_counter()
+    try:
+        compiled = CompiledForest.from_sklearn(model)
+        compiled.verify(model)
+    except Exception as e:
+        print(f"Compilation of {name} failed, using sklearn: {e}")
+        return model
+    model_compile_seconds.set(name, value=time.perf_counter() - started)
+    return compiled
+
+
+# Модели для предсказаний: скомпилированные деревья, совпадающие с sklearn до бита
+br_model = compile_model(br, 'br')
+rf_model = compile_model(rf, 'rf')
 
 # Мэппинги
 LISTING_TYPE_MAPPING = {
@@ -102,45 +190,235 @@ class HousingDataForListingType(BaseModel):
     total_rooms: int
 
 
-def safe_predict_regression(model, input_data):
-    """Безопасное предсказание для регрессионной модели"""
+class FeatureLayout:
+    """Порядок признаков модели и запись полей запроса в массив float64 этого порядка
+
+    Порядок берётся из feature_names_in_ модели и при запуске сверяется с полями
+    модели запроса: расхождение останавливает сервис, а не портит предсказания.
+    """
+
+    def __init__(self, data_model, model=None, name='model'):
+        fields = data_model.model_fields
+        unsupported = [field_name for field_name, field in fields.items() if field.annotation not in (int, float)]
+        if unsupported:
+            raise RuntimeError(f"{data_model.__name__}: only int and float fields are supported, got {unsupported}")
+        # (имя, целое ли, значение по умолчанию или None) для постолбцовой проверки пакетов
+        self.schema = [(field_name, field.annotation is int, None if field.is_required() else field.default)
+                       for field_name, field in fields.items()]
+
+        names = list(fields)
+        if model is not None:
+            model_names = getattr(model, 'feature_names_in_', None)
+            if model_names is None:
+                if model.n_features_in_ != len(names):
+                    raise RuntimeError(f"{name} expects {model.n_features_in_} features, "
+                                       f"{data_model.__name__} has {len(names)} fields")
+            else:
+                model_names = [str(feature) for feature in model_names]
+                missing = [feature for feature in model_names if feature not in fields]
+                unused = [field_name for field_name in names if field_name not in model_names]
+                if missing or unused:
+                    raise RuntimeError(f"{data_model.__name__} does not match the features of {name}: "
+                                       f"missing fields {missing}, fields unknown to the model {unused}")
+                names = model_names
+        self.names = names
+        self._getter = operator.attrgetter(*names)
+        self._local = threading.local()
+
+    def row(self, data):
+        """Признаки запроса в предвыделенном буфере (1, n) текущего потока"""
+        buffer = getattr(self._local, 'buffer', None)
+        if buffer is None:
+            buffer = self._local.buffer = np.empty((1, len(self.names)), dtype=np.float64)
+        buffer[0] = self._getter(data)
+        return buffer
+
+    def matrix(self, columns, rows):
+        """Матрица (строки, n) из столбцов {имя: массив значений}, взятых по маске rows"""
+        matrix = np.empty((int(np.count_nonzero(rows)), len(self.names)), dtype=np.float64)
+        for index, feature in enumerate(self.names):
+            matrix[:, index] = columns[feature][rows]
+        return matrix
+
+
+# Раскладки признаков; несовпадение схемы запроса и модели — ошибка запуска
+PRICE_LAYOUT = FeatureLayout(HousingDataForPrice, br, 'br')
+LISTING_TYPE_LAYOUT = FeatureLayout(HousingDataForListingType, rf, 'rf')
+
+
+class PredictionCache:
+    """Ограниченный LRU-кэш предсказаний одной модели по признакам запроса
+
+    Ключ — строка признаков, приведённая к float32: деревья sklearn и
+    CompiledForest сравнивают признаки именно во float32, поэтому одинаковый
+    ключ всегда означает одинаковое предсказание, в том числе для дробных
+    size и price. clear() вызывается при перезагрузке модели и меняет
+    поколение; запрос передаёт поколение, снятое вместе с моделью, поэтому
+    результат модели, заменённой во время запроса, в кэш не попадает.
+    """
+
+    def __init__(self, name, maxsize=PREDICTION_CACHE_SIZE):
+        self.name = name
+        self.maxsize = maxsize
+        self.generation = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_compute(self, input_data, compute, generation):
+        key = input_data.astype(np.float32).tobytes()
+        with self._lock:
+            # Модель запроса уже заменена — кэш новой модели ей не подходит
+            value = self._data.get(key) if generation == self.generation else None
+            if value is not None:
+                self._data.move_to_end(key)
+        cache_requests.inc(self.name, 'hit' if value is not None else 'miss')
+        if value is not None:
+            return value
+
+        value = compute()
+        with self._lock:
+            if generation == self.generation:
+                self._data[key] = value
+                if len(self._data) > self.maxsize:
+                    self._data.popitem(last=False)
+            size = len(self._data)
+        cache_size.set(self.name, value=size)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.generation += 1
+        cache_size.set(self.name, value=0)
+
+
+price_cache = PredictionCache('br')
+listing_type_cache = PredictionCache('rf')
+
+
+def file_signature(path):
     try:
-        # Дополнительная проверка и исправление атрибутов
-        if hasattr(model, 'estimators_'):
-            for estimator in model.estimators_:
-                if not hasattr(estimator, 'monotonic_cst'):
-                    estimator.monotonic_cst = None
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+model_signatures = {BR_MODEL_PATH: file_signature(BR_MODEL_PATH), RF_MODEL_PATH: file_signature(RF_MODEL_PATH)}
+# Под этой блокировкой модели заменяются вместе со сбросом их кэша и снимаются запросами
+reload_lock = threading.Lock()
+model_watcher_stop = threading.Event()
+
+
+def reload_model(path, data_model, name):
+    """Загружает заменённый файл модели: (модель, модель для предсказаний, раскладка) или None"""
+    model = load_model_with_fix(path)
+    if model is None:
+        return None
+    try:
+        layout = FeatureLayout(data_model, model, name)
+    except RuntimeError as e:
+        print(f"Reloaded {name} rejected, keeping the previous model: {e}")
+        return None
+    return model, compile_model(model, name), layout
+
+
+def reload_changed_models():
+    """Перезагружает изменившиеся файлы моделей и сбрасывает их кэш
+
+    Загрузка, компиляция и проверка идут без блокировки, под reload_lock
+    выполняется только замена, поэтому запросы продолжают работать со старой моделью.
+    """
+    global br, rf, br_model, rf_model, PRICE_LAYOUT, LISTING_TYPE_LAYOUT
+    signature = file_signature(BR_MODEL_PATH)
+    if signature != model_signatures[BR_MODEL_PATH]:
+        model_signatures[BR_MODEL_PATH] = signature
+        reloaded = reload_model(BR_MODEL_PATH, HousingDataForPrice, 'br')
+        if reloaded is not None:
+            with reload_lock:
+                br, br_model, PRICE_LAYOUT = reloaded
+                price_cache.clear()
+            print("Model br reloaded")
+
+    signature = file_signature(RF_MODEL_PATH)
+    if signature != model_signatures[RF_MODEL_PATH]:
+        model_signatures[RF_MODEL_PATH] = signature
+        reloaded = reload_model(RF_MODEL_PATH, HousingDataForListingType, 'rf')
+        if reloaded is not None:
+            with reload_lock:
+                rf, rf_model, LISTING_TYPE_LAYOUT = reloaded
+                listing_type_cache.clear()
+            print("Model rf reloaded")
+
+
+def watch_model_files():
+    """Фоновая проверка файлов моделей раз в MODEL_CHECK_INTERVAL секунд, вне обработки запросов"""
+    while not model_watcher_stop.wait(MODEL_CHECK_INTERVAL):
+        try:
+            reload_changed_models()
+        except Exception as e:
+            print(f"Model reload error: {e}")
+
+
+@app.on_event("startup")
+def start_model_watcher():
+    model_watcher_stop.clear()
+    threading.Thread(target=watch_model_files, name='model-watcher', daemon=True).start()
+
+
+@app.on_event("shutdown")
+def stop_model_watcher():
+    model_watcher_stop.set()
+
+
+def price_model_snapshot():
+    """Исходная модель, модель для предсказаний, раскладка и поколение кэша цены — согласованно"""
+    with reload_lock:
+        return br, br_model, PRICE_LAYOUT, price_cache.generation
+
+
+def listing_type_model_snapshot():
+    """То же для модели типа объявления"""
+    with reload_lock:
+        return rf, rf_model, LISTING_TYPE_LAYOUT, listing_type_cache.generation
 
+
+def safe_predict_regression(model, input_data, cache=None, generation=None):
+    """Безопасное предсказание для регрессионной модели"""
+    try:
+        if cache is not None:
+            return cache.get_or_compute(input_data, lambda: model.predict(input_data)[0], generation)
         result = model.predict(input_data)[0]
         return result
     except Exception as e:
         print(f"Prediction error: {e}")
+        prediction_errors.inc('regression')
         return 0.0
 
 
-def safe_predict_classification(model, input_data):
+def safe_predict_classification(model, input_data, cache=None, generation=None):
     """Безопасное предсказание для классификационной модели"""
     try:
-        # Дополнительная проверка и исправление атрибутов
-        if hasattr(model, 'estimators_'):
-            for estimator in model.estimators_:
-                if not hasattr(estimator, 'monotonic_cst'):
-                    estimator.monotonic_cst = None
-
+        if cache is not None:
+            return cache.get_or_compute(input_data, lambda: model.predict_proba(input_data)[0], generation)
         result = model.predict_proba(input_data)[0]
         return result
     except Exception as e:
         print(f"Classification error: {e}")
+        prediction_errors.inc('classification')
         return np.array([0.5, 0.5])  # Возвращаем равные вероятности при ошибке
 
 
 @app.post("/predict-price")
 def predict_price(data: HousingDataForPrice):
-    if br is None:
+    model, predictor, layout, generation = price_model_snapshot()
+    if model is None:
         return {"error": "Regression model not loaded"}
 
-    input_data = pd.DataFrame([data.dict()])
-    predicted_price = safe_predict_regression(br, input_data)
+    with stage('features'):
+        input_data = layout.row(data)
+    with stage('predict'):
+        predicted_price = safe_predict_regression(predictor, input_data, price_cache, generation)
 
     return {
         "predicted_price": float(predicted_price),
@@ -151,11 +429,14 @@ def predict_price(data: HousingDataForPrice):
 
 @app.post("/predict-listing-type")
 def predict_listing_type(data: HousingDataForListingType):
-    if rf is None:
+    model, predictor, layout, generation = listing_type_model_snapshot()
+    if model is None:
         return {"error": "Classification model not loaded"}
 
-    input_data = pd.DataFrame([data.dict()])
-    probabilities = safe_predict_classification(rf, input_data)
+    with stage('features'):
+        input_data = layout.row(data)
+    with stage('predict'):
+        probabilities = safe_predict_classification(predictor, input_data, listing_type_cache, generation)
     predicted_class = np.argmax(probabilities) + 1  # +1 т.к. индексы начинаются с 0
 
     # Формируем ответ с вероятностями для всех классов
@@ -172,4 +453,407 @@ def predict_listing_type(data: HousingDataForListingType):
     return {
         "predicted_listing_type": predictions[0]["listing_type_code"],
         "predictions": predictions
-    }
\ No newline at end of file
+    }
+
+
+# Диапазон одного признака для /predict-price/sweep: steps точек от start до stop
+class SweepRange(BaseModel):
+    feature: str
+    start: float
+    stop: float
+    steps: int = 50
+
+
+class PriceSweepRequest(BaseModel):
+    base: HousingDataForPrice
+    vary: list[SweepRange]  # Один признак — кривая, два — поверхность
+
+
+def sweep_values(sweep, is_int):
+    """Значения признака на сетке; для целых признаков — без повторов после округления"""
+    values = np.linspace(sweep.start, sweep.stop, sweep.steps)
+    return np.unique(np.round(values)) if is_int else values
+
+
+@app.post("/predict-price/sweep")
+def predict_price_sweep(request: PriceSweepRequest):
+    """Цены на сетке значений одного или двух признаков при остальных из base, одним вызовом модели"""
+    model, predictor, layout, _ = price_model_snapshot()
+    if model is None:
+        return {"error": "Regression model not loaded"}
+
+    is_int = {name: integer for name, integer, _ in layout.schema}
+    features = [sweep.feature for sweep in request.vary]
+    if not 1 <= len(features) <= 2:
+        raise HTTPException(status_code=422, detail="vary must contain one or two features")
+    unknown = [feature for feature in features if feature not in is_int]
+    if unknown:
+        raise HTTPException(status_code=422, detail=f"Unknown features: {unknown}")
+    if len(set(features)) != len(features):
+        raise HTTPException(status_code=422, detail="Features in vary must be different")
+    for sweep in request.vary:
+        if not np.isfinite([sweep.start, sweep.stop]).all():
+            raise HTTPException(status_code=422, detail=f"{sweep.feature}: start and stop must be finite")
+        if is_int[sweep.feature] and max(abs(sweep.start), abs(sweep.stop)) > SWEEP_MAX_INT:
+            raise HTTPException(status_code=422,
+                                detail=f"{sweep.feature}: start and stop must be within ±{SWEEP_MAX_INT}")
+    if any(sweep.steps < 1 for sweep in request.vary):
+        raise HTTPException(status_code=422, detail="steps must be positive")
+    if int(np.prod([sweep.steps for sweep in request.vary])) > SWEEP_MAX_POINTS:
+        raise HTTPException(status_code=422, detail=f"The grid is limited to {SWEEP_MAX_POINTS} points")
+
+    axes = [sweep_values(sweep, is_int[sweep.feature]) for sweep in request.vary]
+    shape = tuple(len(values) for values in axes)
+    with stage('features'):
+        grid = np.repeat(layout.row(request.base), int(np.prod(shape)), axis=0)
+        for feature, values in zip(features, np.meshgrid(*axes, indexing='ij')):
+            grid[:, layout.names.index(feature)] = values.ravel()
+    with stage('predict'):
+        try:
+            prices = predictor.predict(grid).reshape(shape)
+        except Exception as e:
+            print(f"Sweep prediction error: {e}")
+            prediction_errors.inc('regression')
+            return {"error": "Prediction failed"}
+
+    return {
+        "features": features,
+        "values": [values.astype(np.int64).tolist() if is_int[feature] else values.tolist()
+                   for feature, values in zip(features, axes)],
+        "predicted_prices": prices.tolist(),
+        "currency": "TRY",
+        "parameters": request.base.dict()
+    }
+
+
+BATCH_FORMATS = {
+    'application/json': 'json',
+    'text/csv': 'csv',
+    'application/csv': 'csv',
+    'application/vnd.apache.parquet': 'parquet',
+    'application/x-parquet': 'parquet',
+    'application/parquet': 'parquet'
+}
+UPLOAD_SUFFIXES = {'.json': 'json', '.csv': 'csv', '.parquet': 'parquet'}
+
+
+async def read_batch_upload(request):
+    """Формат тела ('json', 'csv' или 'parquet') и само тело во временном файле
+
+    Принимает сырое тело с соответствующим Content-Type или multipart/form-data
+    с файлом в поле file (формат по расширению имени или типу файла).
+    """
+    content_type = request.headers.get('content-type', '').split(';')[0].strip().lower()
+    if content_type == 'multipart/form-data':
+        form = await request.form()
+        upload = form.get('file')
+        if upload is None or isinstance(upload, str):
+            raise HTTPException(status_code=422, detail="Expected an uploaded file in form field 'file'")
+        filename = (upload.filename or '').lower()
+        batch_format = next((fmt for suffix, fmt in UPLOAD_SUFFIXES.items() if filename.endswith(suffix)),
+                            BATCH_FORMATS.get((upload.content_type or '').lower()))
+        file = upload.file
+        file.seek(0)
+    else:
+        batch_format = BATCH_FORMATS.get(content_type)
+        file = tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_SIZE)
+        if batch_format is not None:
+            async for chunk in request.stream():
+                file.write(chunk)
+            file.seek(0)
+
+    if batch_format is None:
+        file.close()
+        raise HTTPException(status_code=415, detail=f"Unsupported format, expected one of: "
+                                                    f"{sorted(set(BATCH_FORMATS.values()))}")
+    if batch_format == 'parquet' and pq is None:
+        file.close()
+        raise HTTPException(status_code=415, detail="Parquet input requires pyarrow")
+    return batch_format, file
+
+
+def iter_json_array(file):
+    """Элементы JSON-массива из двоичного файла по одному, без чтения всего тела в память"""
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder('utf-8-sig')()
+    buffer = ''
+    position = 0
+    eof = False
+
+    def read_more():
+        nonlocal buffer, position, eof
+        if len(buffer) - position > JSON_MAX_ELEMENT_SIZE:
+            raise ValueError(f"Array element is longer than {JSON_MAX_ELEMENT_SIZE} characters")
+        block = file.read(JSON_READ_SIZE)
+        eof = not block
+        # Разобранное начало отбрасывается, только когда занимает больше половины буфера,
+        # поэтому буфер не копируется заново на каждом элементе и остаётся в пределах ~2 * JSON_MAX_ELEMENT_SIZE
+        if position > len(buffer) // 2:
+            buffer = buffer[position:]
+            position = 0
+        buffer += text_decoder.decode(block, final=eof)
+
+    def skip_whitespace():
+        nonlocal position
+        while True:
+            while position < len(buffer) and buffer[position] in ' \t\n\r':
+                position += 1
+            if position < len(buffer) or eof:
+                return
+            read_more()
+
+    skip_whitespace()
+    if buffer[position:position + 1] != '[':
+        raise HTTPException(status_code=422, detail="Expected a JSON array of objects")
+    position += 1
+    skip_whitespace()
+    if buffer[position:position + 1] == ']':
+        position += 1
+    else:
+        while True:
+            while True:
+                try:
+                    value, end = decoder.raw_decode(buffer, position)
+                except ValueError:
+                    if eof:
+                        raise
+                    read_more()
+                    continue
+                # Число могло оборваться на границе блока: 12|34, 1.|5 или 1e|-3
+                if not eof and (end == len(buffer) or buffer[end] in '.eE'):
+                    read_more()
+                    continue
+                break
+            position = end
+            yield value
+            skip_whitespace()
+            separator = buffer[position:position + 1]
+            position += 1
+            if separator == ']':
+                break
+            if separator != ',':
+                raise ValueError("Expecting ',' or ']' after array element")
+            skip_whitespace()
+    skip_whitespace()
+    if position < len(buffer):
+        raise ValueError("Extra data after JSON array")
+
+
+def csv_batch_id(value):
+    """Идентификатор из CSV: целые числа — int (без округления через float64), остальное — как в файле"""
+    return int(value) if re.fullmatch(r'[+-]?[0-9]+', value) else value
+
+
+def iter_batch_frames(batch_format, file, columns):
+    """Блоки входных строк по BATCH_CHUNK_SIZE: (DataFrame, ошибки строк или None)"""
+    wanted = set(columns) | {BATCH_ID_COLUMN}
+    if batch_format == 'json':
+        records = iter_json_array(file)
+        while True:
+            try:
+                chunk = list(itertools.islice(records, BATCH_CHUNK_SIZE))
+            except ValueError as e:
+                raise HTTPException(status_code=422, detail=f"Invalid JSON: {e}")
+            if not chunk:
+                return
+            errors = [None if isinstance(record, dict) else "Expected a JSON object" for record in chunk]
+            frame = pd.DataFrame([record if isinstance(record, dict) else {} for record in chunk],
+                                 index=range(len(chunk)))
+            if BATCH_ID_COLUMN in frame.columns:
+                # Значения как в JSON: иначе при пропуске у части строк pandas приводит целые id к float64
+                frame[BATCH_ID_COLUMN] = pd.Series([record.get(BATCH_ID_COLUMN) if isinstance(record, dict) else None
+                                                    for record in chunk], dtype=object)
+            yield frame[[column for column in frame.columns if column in wanted]], errors
+    elif batch_format == 'csv':
+        try:
+            reader = pd.read_csv(file, chunksize=BATCH_CHUNK_SIZE, usecols=lambda column: column in wanted,
+                                 dtype={BATCH_ID_COLUMN: str})
+        except pd.errors.EmptyDataError:
+            raise HTTPException(status_code=422, detail="Empty CSV")
+        with reader:
+            for frame in reader:
+                if BATCH_ID_COLUMN in frame.columns:
+                    frame[BATCH_ID_COLUMN] = frame[BATCH_ID_COLUMN].map(csv_batch_id, na_action='ignore')
+                yield frame.reset_index(drop=True), None
+    else:
+        try:
+            parquet = pq.ParquetFile(file)
+        except Exception as e:
+            raise HTTPException(status_code=422, detail=f"Invalid Parquet file: {e}")
+        present = [column for column in parquet.schema_arrow.names if column in wanted]
+        for batch in parquet.iter_batches(batch_size=BATCH_CHUNK_SIZE, columns=present):
+            # Целые столбцы с пропусками — объекты int/None, а не float64 (важно для id)
+            yield batch.to_pandas(integer_object_nulls=True), None
+
+
+def validate_batch(frame, layout, errors=None):
+    """Постолбцовая проверка блока: матрица признаков допустимых строк и ошибка (или None) для каждой строки"""
+    n_rows = len(frame)
+    errors = list(errors) if errors is not None else [None] * n_rows
+    features = {}
+    for name, is_int, default in layout.schema:
+        if name in frame.columns:
+            raw = frame[name]
+            # Копия: без неё to_numpy может вернуть доступное только для чтения представление столбца
+            values = pd.to_numeric(raw, errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan, copy=True)
+            missing = raw.isna().to_numpy()
+        else:
+            values = np.full(n_rows, np.nan)
+            missing = np.ones(n_rows, dtype=bool)
+        if default is not None:
+            values[missing] = default
+            missing = np.zeros(n_rows, dtype=bool)
+        if is_int:
+            invalid = ~missing & ~(np.isfinite(values) & (values == np.trunc(values)))
+        else:
+            invalid = ~missing & np.isnan(values)
+        for i in np.flatnonzero(missing | invalid):
+            if errors[i] is None:
+                errors[i] = (f"{name}: field required" if missing[i]
+                             else f"{name}: {'integer' if is_int else 'number'} expected")
+        features[name] = values
+
+    valid = np.array([error is None for error in errors], dtype=bool)
+    return layout.matrix(features, valid), errors
+
+
+def predict_price_rows(model, input_data):
+    return [{"predicted_price": float(price)} for price in model.predict(input_data)]
+
+
+def predict_listing_type_rows(model, input_data):
+    rows = []
+    for probabilities in model.predict_proba(input_data):
+        row = {"predicted_listing_type": int(np.argmax(probabilities)) + 1}
+        for i, prob in enumerate(probabilities):
+            row[f"probability_{i + 1}"] = float(prob)
+        rows.append(row)
+    return rows
+
+
+def stream_batch_predictions(frames, file, layout, predict, kind, fields, output):
+    """Результаты по строкам в NDJSON или CSV; ошибки строк не прерывают пакет"""
+    header = ['row', BATCH_ID_COLUMN] + fields + ['error']
+
+    def render(records):
+        if output == 'ndjson':
+            return ''.join(json.dumps(record, ensure_ascii=False) + '\n' for record in records)
+        buffer = io.StringIO()
+        csv.DictWriter(buffer, header, lineterminator='\n').writerows(records)
+        return buffer.getvalue()
+
+    try:
+        if output == 'csv':
+            yield ','.join(header) + '\n'
+        row_number = 0
+        while True:
+            try:
+                with stage('parse'):
+                    chunk = next(frames, None)
+            except Exception as e:
+                detail = e.detail if isinstance(e, HTTPException) else str(e)
+                yield render([{"row": row_number, "error": f"Input error: {detail}"}])
+                return
+            if chunk is None:
+                return
+            frame, errors = chunk
+            try:
+                with stage('features'):
+                    input_data, errors = validate_batch(frame, layout, errors)
+            except Exception as e:
+                # Ответ уже начат, поэтому сбой проверки блока отмечается в его строках
+                print(f"Batch validation error: {e}")
+                input_data = None
+                errors = [error or f"Validation error: {e}" for error in (errors or [None] * len(frame))]
+            results = iter([])
+            if input_data is not None and len(input_data):
+                try:
+                    with stage('predict'):
+                        results = iter(predict(input_data))
+                except Exception as e:
+                    print(f"Batch prediction error: {e}")
+                    prediction_errors.inc(kind)
+                    errors = [error or "Prediction error" for error in errors]
+
+            ids = None
+            if BATCH_ID_COLUMN in frame.columns:
+                column = frame[BATCH_ID_COLUMN].astype(object)
+                ids = column.where(column.notna(), None).tolist()
+            records = []
+            for i, error in enumerate(errors):
+                record = {"row": row_number + i}
+                if ids is not None:
+                    record[BATCH_ID_COLUMN] = ids[i]
+                if error is None:
+                    record.update(next(results))
+                else:
+                    record["error"] = error
+                records.append(record)
+            row_number += len(errors)
+            yield render(records)
+    finally:
+        frames.close()
+        file.close()
+
+
+async def batch_response(request, output, layout, predict, kind, fields):
+    if output not in ('ndjson', 'csv'):
+        raise HTTPException(status_code=422, detail="output must be 'ndjson' or 'csv'")
+    batch_format, file = await read_batch_upload(request)
+    frames = iter_batch_frames(batch_format, file, [name for name, _, _ in layout.schema])
+    try:
+        first = await run_in_threadpool(next, frames, None)
+    except HTTPException:
+        file.close()
+        raise
+    except Exception as e:
+        file.close()
+        raise HTTPException(status_code=422, detail=f"Input error: {e}")
+    if first is not None and batch_format != 'json':
+        # В CSV и Parquet состав столбцов задан заголовком, поэтому нехватку сообщаем сразу
+        missing = [name for name, _, default in layout.schema if default is None and name not in first[0].columns]
+        if missing:
+            frames.close()
+            file.close()
+            raise HTTPException(status_code=422, detail=f"Missing columns: {missing}")
+
+    def chunks():
+        if first is not None:
+            yield first
+            yield from frames
+
+    media_type = "application/x-ndjson" if output == 'ndjson' else "text/csv"
+    return StreamingResponse(stream_batch_predictions(chunks(), file, layout, predict, kind, fields, output),
+                             media_type=media_type)
+
+
+@app.post("/predict-price/batch")
+async def predict_price_batch(request: Request, output: str = 'ndjson'):
+    """Цены для JSON-массива, CSV или Parquet; ответ — поток NDJSON или CSV по строкам"""
+    model, predictor, layout, _ = price_model_snapshot()
+    if model is None:
+        return {"error": "Regression model not loaded"}
+    return await batch_response(request, output, layout, functools.partial(predict_price_rows, predictor),
+                                'regression', ['predicted_price'])
+
+
+@app.post("/predict-listing-type/batch")
+async def predict_listing_type_batch(request: Request, output: str = 'ndjson'):
+    """Типы объявлений для JSON-массива, CSV или Parquet; ответ — поток NDJSON или CSV по строкам"""
+    model, predictor, layout, _ = listing_type_model_snapshot()
+    if model is None:
+        return {"error": "Classification model not loaded"}
+    return await batch_response(request, output, layout, functools.partial(predict_listing_type_rows, predictor),
+                                'classification', ['predicted_listing_type'] +
+                                [f"probability_{code}" for code in sorted(LISTING_TYPE_MAPPING)])
+
+
+@app.on_event("startup")
+def record_startup_time():
+    startup_seconds.set(value=time.perf_counter() - INIT_STARTED)
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """Метрики сервиса в текстовом формате Prometheus"""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
@@ -57,6 +57,14 @@ SUBTYPE_MAPPING = {
     11: 'Çiftlik Evi (Фермерский дом)', 9: 'Yalı Dairesi (Водная квартира)', 4: 'Loft (Лофт)'
 }
 
+# Параметры для кривой цены: подпись и диапазон, как у слайдеров на странице
+SWEEP_FEATURES = {
+    "size": ("Площадь (м²)", 30.0, 500.0),
+    "total_rooms": ("Количество комнат", 1, 10),
+    "tom": ("Время на рынке (дни)", 0, 180)
+}
+SWEEP_STEPS = 200
+
 def call_api(endpoint, data):
     """Универсальная функция для вызова API"""
     try:
@@ -147,21 +155,21 @@ if page == "Предсказание цены":
         )
         total_rooms = st.slider("Количество комнат", 1, 10, 3)
 
-    if st.button("Предсказать цену", type="primary"):
-        data = {
-            "type": 0,
-            "sub_type": sub_type,
-            "listing_type": listing_type - 1,
-            "tom": tom,
-            "building_age": building_age,
-            "total_floor_count": total_floor_count,
-            "floor_no": floor_no,
-            "size": size,
-            "heating_type": heating_type,
-            "city": city,
-            "total_rooms": total_rooms
-        }
+    data = {
+        "type": 0,
+        "sub_type": sub_type,
+        "listing_type": listing_type - 1,
+        "tom": tom,
+        "building_age": building_age,
+        "total_floor_count": total_floor_count,
+        "floor_no": floor_no,
+        "size": size,
+        "heating_type": heating_type,
+        "city": city,
+        "total_rooms": total_rooms
+    }
 
+    if st.button("Предсказать цену", type="primary"):
         with st.spinner("Рассчитываем цену..."):
             result = call_api("/predict-price", data)
 
@@ -180,6 +188,32 @@ if page == "Предсказание цены":
             elif result and "error" in result:
                 st.error(f"Ошибка: {result['error']}")
 
+    # Кривая цены: один запрос к /predict-price/sweep вместо запроса на каждое положение слайдера
+    st.subheader("Зависимость цены от параметра")
+    sweep_feature = st.selectbox(
+        "Изменяемый параметр",
+        options=list(SWEEP_FEATURES.keys()),
+        format_func=lambda x: SWEEP_FEATURES[x][0]
+    )
+    sweep_label, sweep_start, sweep_stop = SWEEP_FEATURES[sweep_feature]
+
+    if st.button("Построить график"):
+        sweep = {
+            "base": data,
+            "vary": [{"feature": sweep_feature, "start": sweep_start, "stop": sweep_stop, "steps": SWEEP_STEPS}]
+        }
+        with st.spinner("Рассчитываем кривую цены..."):
+            result = call_api("/predict-price/sweep", sweep)
+
+            if result and "predicted_prices" in result:
+                curve = pd.DataFrame(
+                    {"Цена (TRY)": result["predicted_prices"]},
+                    index=pd.Index(result["values"][0], name=sweep_label)
+                )
+                st.line_chart(curve)
+            elif result and "error" in result:
+                st.error(f"Ошибка: {result['error']}")
+
 elif page == "Предсказание типа объявления":
     st.title("Предсказание типа объявления")
 
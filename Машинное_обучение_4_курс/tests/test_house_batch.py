@@ -0,0 +1,66 @@
+import io
+import json
+
+import pandas as pd
+import pytest
+
+import house_main
+from house_main import PRICE_LAYOUT, iter_batch_frames, iter_json_array, stream_batch_predictions
+
+
+def predict_prices(input_data):
+    return [{"predicted_price": 1.0} for _ in range(len(input_data))]
+
+
+def run_batch(batch_format, data):
+    file = io.BytesIO(data)
+    frames = iter_batch_frames(batch_format, file, [name for name, _, _ in PRICE_LAYOUT.schema])
+    output = ''.join(stream_batch_predictions(frames, file, PRICE_LAYOUT, predict_prices, 'regression',
+                                              ['predicted_price'], 'ndjson'))
+    return [json.loads(line) for line in output.splitlines()]
+
+
+def sample_rows():
+    row = {name: 1 for name, _, _ in PRICE_LAYOUT.schema}
+    return [dict(row, id=9007199254740993), dict(row), dict(row, id='abc-1')]
+
+
+def test_batch_ids_keep_their_type_when_some_are_missing():
+    rows = sample_rows()
+    expected = [9007199254740993, None, 'abc-1']
+
+    results = run_batch('json', json.dumps(rows).encode('utf-8'))
+    assert [result['id'] for result in results] == expected
+
+    results = run_batch('csv', pd.DataFrame(rows).to_csv(index=False).encode('utf-8'))
+    assert [result['id'] for result in results] == expected
+    assert all('error' not in result for result in results)
+
+
+def test_parquet_integer_ids_with_missing_values_stay_integers():
+    pa = pytest.importorskip('pyarrow')
+    pq = pytest.importorskip('pyarrow.parquet')
+    # Файл без метаданных pandas, как его пишут другие инструменты
+    columns = {name: pa.array([1, 1], type=pa.int64()) for name, _, _ in PRICE_LAYOUT.schema}
+    columns['id'] = pa.array([9007199254740993, None], type=pa.int64())
+    buffer = io.BytesIO()
+    pq.write_table(pa.table(columns), buffer)
+
+    results = run_batch('parquet', buffer.getvalue())
+    assert [result['id'] for result in results] == [9007199254740993, None]
+    assert all('error' not in result for result in results)
+
+
+def test_json_array_elements_across_read_blocks(monkeypatch):
+    monkeypatch.setattr(house_main, 'JSON_READ_SIZE', 7)
+    records = [{"a": i, "b": [1.5, -2e-3, "ы" * i]} for i in range(50)]
+    data = json.dumps(records, ensure_ascii=False).encode('utf-8')
+    assert list(iter_json_array(io.BytesIO(data))) == records
+
+
+def test_json_array_element_size_is_capped(monkeypatch):
+    monkeypatch.setattr(house_main, 'JSON_READ_SIZE', 16)
+    monkeypatch.setattr(house_main, 'JSON_MAX_ELEMENT_SIZE', 64)
+    assert list(iter_json_array(io.BytesIO(b'[' + b'"' + b'x' * 60 + b'", 1]'))) == ['x' * 60, 1]
+    with pytest.raises(ValueError, match='longer than 64'):
+        list(iter_json_array(io.BytesIO(b'["' + b'x' * 1000)))
@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+from sklearn.ensemble import BaggingRegressor, RandomForestClassifier, RandomForestRegressor
+from sklearn.tree import DecisionTreeRegressor
+
+from house_forest import CompiledForest
+
+
+def make_data(with_missing, n_rows=600, seed=0):
+    rng = np.random.default_rng(seed)
+    X = rng.normal(size=(n_rows, 4))
+    if with_missing:
+        X[rng.random(n_rows) < 0.3, 1] = np.nan
+        X[rng.random(n_rows) < 0.2, 2] = np.nan
+    y = np.where(np.isnan(X[:, 1]), 3 + X[:, 0], 2 * X[:, 0]) + np.where(np.isnan(X[:, 2]), -1, X[:, 3])
+    return X.astype(np.float32), y
+
+
+MODELS = {
+    'bagging': lambda: BaggingRegressor(DecisionTreeRegressor(), n_estimators=20, random_state=0),
+    'rf_regressor': lambda: RandomForestRegressor(n_estimators=20, random_state=0),
+    'rf_classifier': lambda: RandomForestClassifier(n_estimators=20, random_state=0),
+}
+
+
+@pytest.mark.parametrize('with_missing', [False, True], ids=['finite', 'nan'])
+@pytest.mark.parametrize('name', MODELS)
+def test_compiled_forest_matches_sklearn(name, with_missing):
+    X, y = make_data(with_missing)
+    model = MODELS[name]()
+    if name == 'rf_classifier':
+        y = np.digitize(y, [-1, 1])
+    model.fit(X, y)
+    if with_missing:
+        # С пропусками sklearn 1.3+ создаёт внутренние узлы с порогом +inf — они не должны считаться листьями
+        assert any(np.isinf(e.tree_.threshold[e.tree_.children_left != -1]).any() for e in model.estimators_)
+
+    compiled = CompiledForest.from_sklearn(model)
+    compiled.verify(model)
+    X_test, _ = make_data(with_missing, n_rows=300, seed=1)
+    if name == 'rf_classifier':
+        assert np.array_equal(compiled.predict_proba(X_test), model.predict_proba(X_test))
+    assert np.array_equal(compiled.predict(X_test), model.predict(X_test))